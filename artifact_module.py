@@ -0,0 +1,123 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime
+
+from instrumentation_module import timed
+
+# Bump whenever calculate_similarity or the training set construction changes,
+# so artifacts trained on the old features are not reused
+FEATURE_VERSION = 2
+ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+
+@timed('artifact.fingerprint')
+def fingerprint(user_profiles, classifier_type, feature_set='profile'):
+    """SHA-256 over the profile data and training config, independent of dict order"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([FEATURE_VERSION, classifier_type, feature_set]).encode())
+    for name in sorted(user_profiles):
+        profile = user_profiles[name]
+        row = [name, list(profile['interests']), list(profile['friends']), profile['age'],
+               profile['location'], profile['occupation'], profile['activities']]
+        digest.update(json.dumps(row, ensure_ascii=False).encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def artifact_path(directory, classifier_type, feature_set, data_fingerprint):
+    return os.path.join(directory, f"model_{classifier_type}_{feature_set}_{data_fingerprint[:16]}.pkl")
+
+
+def save_model(ml_model, classifier_type, directory=ARTIFACT_DIR, data_fingerprint=None):
+    if not ml_model.is_trained:
+        raise ValueError("Cannot save an untrained model")
+    data_fingerprint = data_fingerprint or fingerprint(ml_model.training_profiles(), classifier_type,
+                                                       ml_model.feature_set)
+    os.makedirs(directory, exist_ok=True)
+    path = artifact_path(directory, classifier_type, ml_model.feature_set, data_fingerprint)
+    artifact = {
+        'fingerprint': data_fingerprint,
+        'classifier_type': classifier_type,
+        'feature_version': FEATURE_VERSION,
+        'feature_set': ml_model.feature_set,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'metrics': ml_model.metrics,
+        'scaler': ml_model.scaler,
+        'model': ml_model.model,
+    }
+    # Write to a temp file and rename, so a crash never leaves a truncated artifact behind
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    # Only the newest artifact per classifier type and feature set is kept
+    for old in glob.glob(os.path.join(directory, f"model_{classifier_type}_{ml_model.feature_set}_*.pkl")):
+        if old != path:
+            os.remove(old)
+    return path
+
+
+@timed('artifact.load_model')
+def load_model(ml_model, classifier_type, directory=ARTIFACT_DIR, data_fingerprint=None):
+    # Returns True if a matching artifact was found and installed on ml_model
+    data_fingerprint = data_fingerprint or fingerprint(ml_model.training_profiles(), classifier_type,
+                                                       ml_model.feature_set)
+    path = artifact_path(directory, classifier_type, ml_model.feature_set, data_fingerprint)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, 'rb') as f:
+            artifact = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        print(f"Ignoring unreadable model artifact {path}: {e}")
+        return False
+    if artifact.get('fingerprint') != data_fingerprint or artifact.get('feature_version') != FEATURE_VERSION:
+        return False
+    ml_model.metrics = artifact.get('metrics', {})
+    ml_model.scaler, ml_model.model = artifact['scaler'], artifact['model']
+    return True
+
+
+def load_or_train(ml_model, classifier_type, directory=ARTIFACT_DIR, force=False):
+    # Reuses a saved artifact when the data and config are unchanged, otherwise trains and saves one.
+    # The fingerprint and the training set come from the same snapshot, so the artifact matches its data
+    profiles = ml_model.training_profiles()
+    data_fingerprint = fingerprint(profiles, classifier_type, ml_model.feature_set)
+    if not force and load_model(ml_model, classifier_type, directory, data_fingerprint):
+        return 'loaded'
+    ml_model.train_model(classifier_type=classifier_type, profiles=profiles)
+    try:
+        save_model(ml_model, classifier_type, directory, data_fingerprint)
+    except OSError as e:
+        print(f"Could not save model artifact: {e}")
+    return 'trained'
+
+
+def main(argv=None):
+    from main import PROFILES_CSV, load_user_profiles
+    from ml_module import MLModel, CLASSIFIER_TYPES, FEATURE_SETS
+
+    parser = argparse.ArgumentParser(description="Pre-train model artifacts for the recommendation system")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--classifier', nargs='+', default=['knn'], choices=CLASSIFIER_TYPES + ['all'])
+    parser.add_argument('--feature-set', default='profile', choices=list(FEATURE_SETS))
+    parser.add_argument('--artifact-dir', default=ARTIFACT_DIR)
+    parser.add_argument('--force', action='store_true', help="retrain even if a matching artifact exists")
+    args = parser.parse_args(argv)
+
+    user_profiles = load_user_profiles(args.profiles)
+    classifier_types = CLASSIFIER_TYPES if 'all' in args.classifier else args.classifier
+    for classifier_type in classifier_types:
+        ml_model = MLModel(user_profiles, args.feature_set)
+        status = load_or_train(ml_model, classifier_type, args.artifact_dir, force=args.force)
+        print(f"{classifier_type}: {status} (test accuracy {ml_model.metrics.get('test_accuracy')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from main import PROFILES_CSV, load_user_profiles, create_social_network
+from ml_module import MLModel
+from search_module import FriendRecommendation
+from rerank_module import DIVERSITY_METHODS, rerank
+
+# Vocabularies used by the synthetic generator (ordered from most to least popular)
+FIRST_NAMES = [
+    "Ahmed", "Mohamed", "Omar", "Ali", "Youssef", "Kareem", "Mostafa", "Hassan", "Mahmoud", "Khaled",
+    "Sara", "Nour", "Fatima", "Layla", "Hana", "Malak", "Amina", "Mariam", "Salma", "Nagham",
+    "Zain", "Adam", "Yara", "Farida", "Tarek", "Ziad", "Rana", "Dina", "Hussein", "Bedo",
+]
+INTERESTS = [
+    "Music", "Movies", "Sports", "Reading", "Traveling", "Gaming", "Cooking", "Photography",
+    "Art", "Technology", "Fashion", "Fitness", "Dancing", "History", "Science", "Politics",
+    "Nature", "Cars", "Anime", "Writing", "Podcasts", "Design", "Theatre", "Volunteering",
+    "Astronomy", "Chess", "Gardening", "Languages", "Economics", "Philosophy", "Pets", "Coffee",
+    "Comics", "Architecture", "Poetry", "Investing", "Board Games", "Meditation", "Robotics", "Cycling",
+]
+ACTIVITIES = [
+    "Football", "Reading", "Music", "Traveling", "Swimming", "Running", "Gym", "Cooking",
+    "Movies", "Dancing", "Hiking", "Painting", "Gaming", "Basketball", "Tennis", "Yoga",
+    "Cycling", "Camping", "Fishing", "Singing", "Volunteering", "Photography", "Chess", "Writing",
+    "Shopping", "Karaoke", "Squash", "Diving", "Climbing", "Boxing",
+]
+LOCATIONS = [
+    "Cairo", "Giza", "Alexandria", "Mansoura", "Tanta", "Zagazig", "Ismailia", "Port Said",
+    "Suez", "Aswan", "Luxor", "Asyut", "Minya", "Sohag", "Hurghada", "Damietta",
+    "Faiyum", "Beni Suef", "Qena", "Sharm El Sheikh",
+]
+OCCUPATIONS = [
+    "Student", "Engineer", "Doctor", "Teacher", "Accountant", "Designer", "Developer", "Nurse",
+    "Lawyer", "Pharmacist", "Architect", "Manager", "Sales", "Chef", "Journalist", "Artist",
+    "Researcher", "Driver", "Photographer", "Entrepreneur",
+]
+
+CSV_FIELDS = ['name', 'interests', 'friends', 'age', 'location', 'occupation', 'activities']
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _pick_many(rng, vocabulary, weights, low, high):
+    count = int(rng.integers(low, high + 1))
+    picks = rng.choice(len(vocabulary), size=min(count, len(vocabulary)), replace=False, p=weights)
+    return [vocabulary[i] for i in picks]
+
+
+def generate_edges(n_users, avg_degree=8, exponent=2.5, seed=42):
+    """Power-law friend graph (configuration model) as an (E, 2) array of user indices"""
+    rng = np.random.default_rng(seed)
+    # Discrete Pareto degrees, rescaled so the mean is close to avg_degree
+    raw = rng.pareto(exponent - 1, size=n_users) + 1
+    degrees = np.maximum(1, np.round(raw * avg_degree / raw.mean())).astype(np.int64)
+    degrees = np.minimum(degrees, n_users - 1)
+    if degrees.sum() % 2:
+        degrees[0] += 1
+
+    # Pair shuffled stubs, then drop self-loops and duplicate edges
+    stubs = rng.permutation(np.repeat(np.arange(n_users, dtype=np.int64), degrees))
+    pairs = stubs.reshape(-1, 2)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs.sort(axis=1)
+    # Every user needs at least one friend, since the CSV schema has no way to say "none"
+    lonely = np.setdiff1d(np.arange(n_users), pairs.ravel())
+    if len(lonely):
+        partners = (lonely + rng.integers(1, n_users, size=len(lonely))) % n_users
+        extra = np.sort(np.stack([lonely, partners], axis=1), axis=1)
+        pairs = np.concatenate([pairs, extra])
+    keys = np.unique(pairs[:, 0] * n_users + pairs[:, 1])
+    return np.stack([keys // n_users, keys % n_users], axis=1)
+
+
+def generate_user_profiles_csv(filename, n_users, avg_degree=8, seed=42):
+    """Write a synthetic dataset with the same schema as user_profiles.csv"""
+    rng = np.random.default_rng(seed)
+    names = [f"{FIRST_NAMES[i % len(FIRST_NAMES)]}{i}" for i in range(n_users)]
+
+    edges = generate_edges(n_users, avg_degree=avg_degree, seed=seed)
+    # Build a CSR adjacency so each row's friend list can be streamed out
+    both = np.concatenate([edges, edges[:, ::-1]])
+    both = both[np.argsort(both[:, 0], kind='stable')]
+    indptr = np.searchsorted(both[:, 0], np.arange(n_users + 1))
+    neighbors = both[:, 1]
+
+    interest_weights = _zipf_weights(len(INTERESTS))
+    activity_weights = _zipf_weights(len(ACTIVITIES))
+    location_weights = _zipf_weights(len(LOCATIONS), exponent=0.9)
+    occupation_weights = _zipf_weights(len(OCCUPATIONS), exponent=0.8)
+    ages = np.clip(rng.normal(28, 8, size=n_users), 16, 70).astype(int)
+    locations = rng.choice(len(LOCATIONS), size=n_users, p=location_weights)
+    occupations = rng.choice(len(OCCUPATIONS), size=n_users, p=occupation_weights)
+
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_FIELDS)
+        for i in range(n_users):
+            friends = neighbors[indptr[i]:indptr[i + 1]]
+            writer.writerow([
+                names[i],
+                ', '.join(_pick_many(rng, INTERESTS, interest_weights, 1, 4)),
+                ', '.join(names[j] for j in friends),
+                ages[i],
+                LOCATIONS[locations[i]],
+                OCCUPATIONS[occupations[i]],
+                ', '.join(_pick_many(rng, ACTIVITIES, activity_weights, 1, 3)),
+            ])
+    return len(edges)
+
+
+class StageTimer:
+    """Times a benchmark stage and records its peak traced memory"""
+
+    def __init__(self, results, name, trace_memory=True):
+        self.results = results
+        self.name = name
+        self.trace_memory = trace_memory
+        self.extra = {}
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        entry = {'seconds': round(elapsed, 6)}
+        if self.trace_memory:
+            entry['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 3)
+        entry.update(self.extra)
+        self.results[self.name] = entry
+        return False
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def render_graph_headless(social_network, layout='spring', zoom=0.6, node_size=1500):
+    # Same layout and draw work as FriendRecommendationApp.update_graph, on an Agg canvas
+    from render_module import compute_layout, draw_network, new_figure
+
+    pos = compute_layout(social_network, layout)
+    figure = new_figure(zoom)
+    draw_network(figure, social_network, pos, zoom=zoom, node_size=node_size, labels=True)
+    figure.canvas.draw()
+
+
+def measure_time_to_first_window(profiles_path, timeout=120):
+    # Launches main.py and waits for it to report that its Tk window was mapped
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        return {'skipped': "no DISPLAY for Tk"}
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, main_path, '--profiles', profiles_path, '--exit-after-first-window'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in process.stdout:
+            if line.startswith('first_window_seconds='):
+                wall = time.perf_counter() - start
+                return {'seconds': round(wall, 6), 'in_process_seconds': float(line.split('=')[1])}
+        return {'skipped': f"main.py exited with code {process.wait(timeout)} before showing a window"}
+    finally:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def time_queries(results, name, recommend, queries, trace=True):
+    latencies = []
+    with StageTimer(results, name, trace) as stage:
+        for user in queries:
+            start = time.perf_counter()
+            recommend(user)
+            latencies.append(time.perf_counter() - start)
+        stage.extra['queries'] = len(queries)
+        stage.extra['p50_ms'] = round(_percentile(latencies, 50) * 1000, 3)
+        stage.extra['p95_ms'] = round(_percentile(latencies, 95) * 1000, 3)
+
+
+def add_model_arguments(parser):
+    # Options shared by the serving benchmarks (shard, shared store, materialized view, SQLite store)
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--classifier', default='knn')
+    parser.add_argument('--max-pairs', type=int, default=5000, help="training pairs sampled for the model")
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def load_and_train(args, queries=None):
+    """(user_profiles, ml_model, query users) for add_model_arguments options
+
+    The model is trained on a sample of args.max_pairs pairs; queries users are sampled with args.seed,
+    or all users are returned when queries is None.
+    """
+    user_profiles = load_user_profiles(args.profiles)
+    ml_model = MLModel(user_profiles)
+    ml_model.train_model(classifier_type=args.classifier, max_pairs=args.max_pairs)
+    users = list(user_profiles)
+    if queries is not None:
+        users = random.Random(args.seed).sample(users, min(queries, len(users)))
+    return user_profiles, ml_model, users
+
+
+def scores_match(results, expected, users=None):
+    """True if every user's recommendations have the same scores as expected[user], in order
+
+    Entries are (candidate, (probability, similarities)) or (candidate, probability). Scores are
+    compared to 9 places and names are not compared: they may differ among tied scores, since
+    neighbor order differs between the graph implementations.
+    """
+    def probabilities(recommendations):
+        return [round(score[0] if isinstance(score, tuple) else score, 9) for _, score in recommendations]
+
+    return all(probabilities(results[user]) == probabilities(expected[user])
+               for user in (expected if users is None else users))
+
+
+def run_benchmark(n_users, args, workdir):
+    results = {}
+    trace = not args.no_tracemalloc
+    filename = os.path.join(workdir, f"profiles_{n_users}.csv")
+
+    with StageTimer(results, 'generate', trace) as stage:
+        stage.extra['edges'] = generate_user_profiles_csv(
+            filename, n_users, avg_degree=args.avg_degree, seed=args.seed)
+
+    if args.startup:
+        results['time_to_first_window'] = measure_time_to_first_window(filename)
+
+    with StageTimer(results, 'load_user_profiles', trace):
+        user_profiles = load_user_profiles(filename)
+
+    with StageTimer(results, 'create_social_network', trace):
+        social_network = create_social_network(user_profiles)
+
+    ml_model = MLModel(user_profiles)
+    if n_users <= args.max_train_users:
+        with StageTimer(results, 'train_model', trace):
+            ml_model.train_model(classifier_type=args.classifier)
+    else:
+        results['train_model'] = {'skipped': f"more than {args.max_train_users} users"}
+        ml_model.train_model(classifier_type=args.classifier, max_pairs=5000)
+
+    # Full training set streamed from a memmap; compare peak_mb with train_model above
+    if n_users <= args.max_out_of_core_users:
+        with StageTimer(results, 'train_model_out_of_core', trace) as stage:
+            stage.extra['rows'] = MLModel(user_profiles).train_model_out_of_core('logistic', epochs=1)['rows']
+    else:
+        results['train_model_out_of_core'] = {'skipped': f"more than {args.max_out_of_core_users} users"}
+
+    friend_recommendation = FriendRecommendation(social_network, user_profiles, ml_model)
+    rng = random.Random(args.seed)
+    queries = rng.sample(list(user_profiles), min(args.queries, len(user_profiles)))
+    time_queries(results, 'find_recommendations', friend_recommendation.find_recommendations, queries, trace)
+
+    results['find_recommendations']['users_per_s'] = round(len(queries) / results['find_recommendations']['seconds'], 1)
+
+    # Batched queries share traversal and scoring work across users
+    batch_users = rng.sample(list(user_profiles), min(args.batch_users, len(user_profiles)))
+    with StageTimer(results, 'find_recommendations_batch', trace) as stage:
+        batch_results = friend_recommendation.find_recommendations_batch(batch_users)
+        stage.extra['users'] = len(batch_users)
+    results['find_recommendations_batch']['users_per_s'] = round(
+        len(batch_users) / results['find_recommendations_batch']['seconds'], 1)
+
+    # Latency that diversity reranking adds on top of the scored lists above
+    profiles = friend_recommendation.snapshot().profiles
+    for method in DIVERSITY_METHODS:
+        name = f'rerank_{method}'
+        with StageTimer(results, name, trace):
+            for user in batch_users:
+                rerank(user, batch_results[user], profiles, ml_model, top_k=10, method=method)
+        results[name]['us_per_query'] = round(results[name]['seconds'] / len(batch_users) * 1e6, 1)
+
+    # Vectorized feature kernel against the per-pair scalar version, on the same candidates
+    kernel_user = queries[0]
+    candidates = [user for user in rng.sample(list(user_profiles), min(2000, len(user_profiles)))
+                  if user != kernel_user]
+    start = time.perf_counter()
+    scalar = np.array([ml_model.calculate_similarity(kernel_user, user) for user in candidates], dtype=np.float32)
+    scalar_seconds = time.perf_counter() - start
+    with StageTimer(results, 'similarity_matrix', trace) as stage:
+        kernel = ml_model.similarity_matrix(kernel_user, candidates)
+        stage.extra['candidates'] = len(candidates)
+    results['similarity_matrix']['us_per_candidate'] = round(
+        results['similarity_matrix']['seconds'] / len(candidates) * 1e6, 3)
+    results['similarity_matrix']['scalar_us_per_candidate'] = round(scalar_seconds / len(candidates) * 1e6, 3)
+    results['similarity_matrix']['matches'] = bool(np.array_equal(kernel, scalar))
+
+    # Personalized PageRank candidate generation, against the BFS path above
+    with StageTimer(results, 'ppr_index_build', trace):
+        friend_recommendation.get_walk_index()
+    time_queries(results, 'find_recommendations_ppr', friend_recommendation.find_recommendations_ppr, queries, trace)
+
+    if n_users <= args.max_render_users:
+        with StageTimer(results, 'update_graph', trace):
+            render_graph_headless(social_network)
+    else:
+        results['update_graph'] = {'skipped': f"more than {args.max_render_users} users"}
+
+    if not args.keep_data:
+        os.remove(filename)
+    return results
+
+
+def find_regressions(results, baseline, tolerance=0.25, min_seconds=0.01):
+    regressions = []
+    for size, stages in results['runs'].items():
+        for stage, entry in stages.items():
+            base = baseline.get('runs', {}).get(size, {}).get(stage)
+            if not base or 'seconds' not in base or 'seconds' not in entry:
+                continue
+            if entry['seconds'] - base['seconds'] < min_seconds:
+                continue
+            if entry['seconds'] > base['seconds'] * (1 + tolerance):
+                regressions.append((size, stage, base['seconds'], entry['seconds']))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'users':>9}  {'stage':<26}{'seconds':>10}{'peak MB':>10}  notes")
+    for size, stages in results['runs'].items():
+        for stage, entry in stages.items():
+            if 'skipped' in entry:
+                print(f"{size:>9}  {stage:<26}{'-':>10}{'-':>10}  skipped: {entry['skipped']}")
+                continue
+            notes = ', '.join(f"{k}={v}" for k, v in entry.items() if k not in ('seconds', 'peak_mb'))
+            peak = entry.get('peak_mb', '-')
+            print(f"{size:>9}  {stage:<26}{entry['seconds']:>10.4f}{peak:>10}  {notes}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the friend recommendation pipeline on synthetic data")
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000],
+                        help="dataset sizes to benchmark (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument('--avg-degree', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--queries', type=int, default=20, help="find_recommendations calls per size")
+    parser.add_argument('--batch-users', type=int, default=1000, help="users per find_recommendations_batch call")
+    parser.add_argument('--classifier', default='knn')
+    parser.add_argument('--max-train-users', type=int, default=300,
+                        help="skip train_model above this size (it is O(E·N))")
+    parser.add_argument('--max-out-of-core-users', type=int, default=1000,
+                        help="skip the out-of-core training stage above this size")
+    parser.add_argument('--max-render-users', type=int, default=1000)
+    parser.add_argument('--startup', action='store_true',
+                        help="also measure main.py time-to-first-window (needs a display)")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="disable peak memory tracking")
+    parser.add_argument('--keep-data', action='store_true', help="keep generated CSV files")
+    parser.add_argument('--data-dir', help="where to write generated CSV files")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="baseline results to compare against")
+    parser.add_argument('--save-baseline', help="also write these results as a new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown vs baseline before flagging a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'avg_degree': args.avg_degree,
+            'classifier': args.classifier,
+        },
+        'runs': {},
+    }
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    workdir = args.data_dir or tempfile.mkdtemp(prefix='frs_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    for n_users in args.users:
+        print(f"Benchmarking {n_users} users...")
+        results['runs'][str(n_users)] = run_benchmark(n_users, args, workdir)
+    if not args.no_tracemalloc:
+        tracemalloc.stop()
+    results['meta']['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    print_table(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, tolerance=args.tolerance)
+        for size, stage, before, after in regressions:
+            print(f"REGRESSION {size} users / {stage}: {before:.4f}s -> {after:.4f}s")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import threading
+from itertools import compress, repeat
+from operator import is_not, itemgetter
+
+import numpy as np
+
+_NO_ROW = (None, None)
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        return np.bitwise_count(words)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        # Per-byte lookup for NumPy < 2.0, summed back to one count per uint64 word
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _POPCOUNT_TABLE[as_bytes].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+class BitsetEncoder:
+    """Encodes each user's set of tokens (interests, activities, ...) as packed bits over a shared vocabulary
+
+    Every user is available both as a Python int (fast single-pair AND + bit_count) and as a row of a
+    uint64 matrix, so one user can be compared against a whole candidate array with vectorized AND + popcount.
+    """
+
+    def __init__(self, capacity=1024, words=1):
+        self.vocabulary = {}
+        self.tokens = []
+        self.masks = {}  # user -> Python int bitmask
+        self.rows = {}  # user -> row in self.bits
+        self.bits = np.zeros((capacity, words), dtype=np.uint64)
+        self.lock = threading.Lock()
+
+    def encode(self, user, items):
+        with self.lock:
+            mask = 0
+            for item in items:
+                bit = self.vocabulary.get(item)
+                if bit is None:
+                    bit = self.vocabulary[item] = len(self.tokens)
+                    self.tokens.append(item)
+                mask |= 1 << bit
+            self._store(user, mask)
+            return mask
+
+    def _store(self, user, mask):
+        words_needed = max(1, (len(self.tokens) + 63) // 64)
+        rows, words = self.bits.shape
+        row = self.rows.get(user)
+        if row is None:
+            row = len(self.rows)
+        if row >= rows or words_needed > words:
+            new_rows = max(rows * 2, row + 1) if row >= rows else rows
+            grown = np.zeros((new_rows, max(words, words_needed)), dtype=np.uint64)
+            grown[:rows, :words] = self.bits
+            self.bits = grown
+        for w in range(self.bits.shape[1]):
+            self.bits[row, w] = (mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF
+        self.masks[user] = mask
+        self.rows[user] = row
+
+    def __contains__(self, user):
+        return user in self.masks
+
+    def mask(self, user):
+        return self.masks[user]
+
+    def decode(self, mask):
+        return [token for bit, token in enumerate(self.tokens) if mask >> bit & 1]
+
+    def overlap(self, user, other):
+        return (self.masks[user] & self.masks[other]).bit_count()
+
+    def union(self, user, other):
+        return (self.masks[user] | self.masks[other]).bit_count()
+
+    def overlap_many(self, user, others):
+        # Shared-token counts between user and every user in others, as an int array
+        row = self.bits[self.rows[user]]
+        candidates = self.bits[list(map(self.rows.__getitem__, others))]
+        return popcount(candidates & row).sum(axis=1, dtype=np.int64)
+
+    def jaccard_many(self, user, others):
+        row = self.bits[self.rows[user]]
+        candidates = self.bits[list(map(self.rows.__getitem__, others))]
+        inter = popcount(candidates & row).sum(axis=1, dtype=np.int64)
+        union = popcount(candidates | row).sum(axis=1, dtype=np.int64)
+        return np.divide(inter, union, out=np.zeros(len(inter)), where=union > 0)
+
+
+class ProfileEncoder:
+    """Bitset encodings of user_profiles interests and activities, filled in lazily per user
+
+    Age, occupation and location are kept alongside as integer columns (categories as codes), indexed by
+    the user's row in self.activities, so they can be compared against many candidates at once.
+    Friend lists given as tuples (snapshot profiles, which never change in place) are also kept as
+    arrays of node IDs, so mutual friends can be counted by marking and summing, like SharedGraphView.
+    """
+
+    def __init__(self, user_profiles):
+        self.user_profiles = user_profiles
+        self.interests = BitsetEncoder()
+        self.activities = BitsetEncoder()
+        self.codes = {'occupation': {}, 'location': {}}
+        self.columns = np.zeros((1024, 3), dtype=np.int64)  # activities row -> (age, occupation, location)
+        self.node_ids = {}  # Any name seen as a user or a friend -> node ID
+        self.friend_rows = {}  # user -> (friends tuple, its node IDs), reused while the profile keeps that tuple
+        self._local = threading.local()  # Per-thread mark array for mutual_friends
+        self.lock = threading.Lock()
+
+    def _encode(self, user, profile):
+        # Interests last: membership is checked on self.interests, so everything is ready once it is set
+        self.activities.encode(user, profile['activities'].split(', '))
+        self._store_columns(user, profile)
+        self.interests.encode(user, profile['interests'])
+
+    def _store_columns(self, user, profile):
+        with self.lock:
+            row = self.activities.rows[user]
+            if row >= len(self.columns):
+                grown = np.zeros((max(len(self.columns) * 2, row + 1), 3), dtype=np.int64)
+                grown[:len(self.columns)] = self.columns
+                self.columns = grown
+            occupations = self.codes['occupation']
+            locations = self.codes['location']
+            self.columns[row] = (profile['age'],
+                                 occupations.setdefault(profile['occupation'], len(occupations)),
+                                 locations.setdefault(profile['location'], len(locations)))
+
+    def ensure(self, user, profiles=None):
+        # profiles defaults to self.user_profiles; callers holding the profiles already pass them
+        if user not in self.interests:
+            self._encode(user, (self.user_profiles if profiles is None else profiles)[user])
+
+    def ensure_many(self, users, profiles=None):
+        for user in [user for user in users if user not in self.interests.masks]:
+            self.ensure(user, profiles)
+
+    def refresh(self, user):
+        # Re-encode after a profile's interests, activities, age, occupation or location were edited
+        self._encode(user, self.user_profiles[user])
+
+    def column_rows(self, users):
+        # Rows of self.columns (and self.activities.bits) for users, which must already be encoded
+        return np.fromiter(map(self.activities.rows.__getitem__, users), dtype=np.int64, count=len(users))
+
+    def _friend_row(self, user, friends):
+        # (friends, node IDs of friends), cached for user until their profile has a new friends tuple
+        with self.lock:
+            node_ids = self.node_ids
+            ids = np.fromiter((node_ids.setdefault(friend, len(node_ids)) for friend in friends),
+                              dtype=np.int32, count=len(friends))
+        row = self.friend_rows[user] = (friends, ids)
+        return row
+
+    def mutual_friends(self, user, candidates, profiles):
+        """Number of friends user shares with each candidate, or None unless every friend list is a tuple
+
+        user's friends are marked once in a node-ID array, and each candidate's count is the sum of the
+        marks over its friend IDs, with all candidates' IDs gathered into one array. The cached rows are
+        looked up with map() over the names, so no Python code runs per candidate once they are cached.
+        Tuples are assumed to hold no duplicates, as snapshot friend lists (built from FriendSets) do.
+        """
+        names = [user, *candidates]
+        friend_lists = list(map(itemgetter('friends'), map(profiles.__getitem__, names)))
+        rows = list(map(self.friend_rows.get, names, repeat(_NO_ROW)))
+        for i in list(compress(range(len(names)), map(is_not, map(itemgetter(0), rows), friend_lists))):
+            if type(friend_lists[i]) is not tuple:  # Only immutable lists can be cached by identity
+                return None
+            rows[i] = self._friend_row(names[i], friend_lists[i])
+        rows = list(map(itemgetter(1), rows))
+        own, rows = rows[0], rows[1:]
+        mark = getattr(self._local, 'mark', None)
+        if mark is None or len(mark) < len(self.node_ids):
+            mark = self._local.mark = np.zeros(max(1024, 2 * len(self.node_ids)), dtype=np.int8)
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        gathered = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        mark[own] = 1
+        totals = np.concatenate(([0], np.cumsum(mark[gathered], dtype=np.int64)))
+        mark[own] = 0
+        ends = np.cumsum(lengths)
+        return totals[ends] - totals[ends - lengths]
+
+    def shared_interests(self, user, other):
+        self.ensure(user)
+        self.ensure(other)
+        return self.interests.overlap(user, other)
+
+    def activity_similarity(self, user, other):
+        self.ensure(user)
+        self.ensure(other)
+        union = self.activities.union(user, other)
+        return self.activities.overlap(user, other) / union if union else 0
@@ -0,0 +1,174 @@
+import argparse
+import copy
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+from main import PROFILES_CSV, load_user_profiles, create_social_network
+from ml_module import MLModel, FEATURE_SETS
+from search_module import FriendRecommendation
+
+
+def hold_out_edges(user_profiles, fraction=0.2, seed=42):
+    """Hide a fraction of friendships; returns (train_profiles, hidden) with hidden[user] = set of friends"""
+    rng = random.Random(seed)
+    edges = sorted({tuple(sorted((user, friend)))
+                    for user, profile in user_profiles.items()
+                    for friend in profile['friends'] if friend in user_profiles and friend != user})
+    rng.shuffle(edges)
+
+    train_profiles = copy.deepcopy(user_profiles)
+    degree = {user: len(profile['friends']) for user, profile in train_profiles.items()}
+    hidden = {}
+    target = int(len(edges) * fraction)
+    removed = 0
+    for a, b in edges:
+        if removed >= target:
+            break
+        # Keep at least one friend on both sides so every query user is still reachable
+        if degree[a] <= 1 or degree[b] <= 1:
+            continue
+        train_profiles[a]['friends'].discard(b)
+        train_profiles[b]['friends'].discard(a)
+        degree[a] -= 1
+        degree[b] -= 1
+        hidden.setdefault(a, set()).add(b)
+        hidden.setdefault(b, set()).add(a)
+        removed += 1
+    return train_profiles, hidden
+
+
+def precision_at_k(ranked, relevant, k):
+    return sum(1 for name in ranked[:k] if name in relevant) / k
+
+
+def recall_at_k(ranked, relevant, k):
+    return sum(1 for name in ranked[:k] if name in relevant) / len(relevant)
+
+
+def average_precision_at_k(ranked, relevant, k):
+    hits = 0
+    total = 0.0
+    for i, name in enumerate(ranked[:k], 1):
+        if name in relevant:
+            hits += 1
+            total += hits / i
+    return total / min(len(relevant), k)
+
+
+def ndcg_at_k(ranked, relevant, k):
+    dcg = sum(1 / math.log2(i + 1) for i, name in enumerate(ranked[:k], 1) if name in relevant)
+    ideal = sum(1 / math.log2(i + 1) for i in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal
+
+
+def evaluate(recommend, hidden, ks=(5, 10), users=None):
+    """Runs recommend(user) -> ranked names for each user with hidden edges and scores the lists"""
+    users = users if users is not None else sorted(hidden)
+    scores = {f"{metric}@{k}": [] for k in ks for metric in ('precision', 'recall', 'map', 'ndcg')}
+    latencies = []
+    for user in users:
+        start = time.perf_counter()
+        ranked = recommend(user)
+        latencies.append(time.perf_counter() - start)
+        relevant = hidden[user]
+        for k in ks:
+            scores[f"precision@{k}"].append(precision_at_k(ranked, relevant, k))
+            scores[f"recall@{k}"].append(recall_at_k(ranked, relevant, k))
+            scores[f"map@{k}"].append(average_precision_at_k(ranked, relevant, k))
+            scores[f"ndcg@{k}"].append(ndcg_at_k(ranked, relevant, k))
+
+    result = {name: float(np.mean(values)) if values else 0.0 for name, values in scores.items()}
+    total = sum(latencies)
+    result.update({
+        'queries': len(users),
+        'latency_mean_ms': total / len(users) * 1000 if users else 0.0,
+        'latency_p50_ms': float(np.percentile(latencies, 50)) * 1000 if users else 0.0,
+        'latency_p95_ms': float(np.percentile(latencies, 95)) * 1000 if users else 0.0,
+        'throughput_qps': len(users) / total if total else 0.0,
+    })
+    return result
+
+
+def build_recommenders(friend_recommendation):
+    # Candidate generator + scorer combinations to compare; each returns a ranked list of names
+    social_network = friend_recommendation.social_network
+
+    def bfs_ml(user):
+        return [name for name, _ in friend_recommendation.find_recommendations(user)]
+
+    def mutual_friends(user):
+        # Baseline: friends-of-friends ranked by number of common neighbors
+        friends = set(social_network.neighbors(user))
+        counts = {}
+        for friend in friends:
+            for candidate in social_network.neighbors(friend):
+                if candidate != user and candidate not in friends:
+                    counts[candidate] = counts.get(candidate, 0) + 1
+        return sorted(counts, key=lambda name: -counts[name])
+
+    def ppr(user):
+        # Pure personalized PageRank ranking, without the ML scorer
+        scores = friend_recommendation.get_walk_index().personalized_pagerank(user, seed=0)
+        friends = set(social_network.neighbors(user))
+        return [node for node in sorted(scores, key=lambda node: -scores[node])
+                if node != user and node not in friends]
+
+    def ppr_ml(user):
+        return [name for name, _ in friend_recommendation.find_recommendations_ppr(user, top_k=None)]
+
+    friend_recommendation.get_walk_index()  # Build outside the timed queries
+    return {'bfs_ml': bfs_ml, 'mutual_friends': mutual_friends, 'ppr': ppr, 'ppr_ml': ppr_ml}
+
+
+def print_table(results, ks):
+    columns = [f"{metric}@{k}" for k in ks for metric in ('precision', 'recall', 'map', 'ndcg')]
+    print(f"{'recommender':<18}" + ''.join(f"{c:>14}" for c in columns) + f"{'p50 ms':>10}{'p95 ms':>10}{'qps':>10}")
+    for name, result in results.items():
+        print(f"{name:<18}" + ''.join(f"{result[c]:>14.4f}" for c in columns)
+              + f"{result['latency_p50_ms']:>10.3f}{result['latency_p95_ms']:>10.3f}{result['throughput_qps']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ranking evaluation with edge hold-out")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--holdout', type=float, default=0.2, help="fraction of edges to hide")
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--classifier', default='knn')
+    parser.add_argument('--feature-set', default='profile', choices=list(FEATURE_SETS))
+    parser.add_argument('--max-pairs', type=int, help="train on a sample of pairs instead of the full set")
+    parser.add_argument('--max-queries', type=int, help="evaluate a random subset of affected users")
+    parser.add_argument('--recommender', nargs='+', help="only run these recommenders")
+    parser.add_argument('--output', default='evaluation_results.json')
+    args = parser.parse_args(argv)
+
+    user_profiles = load_user_profiles(args.profiles)
+    train_profiles, hidden = hold_out_edges(user_profiles, args.holdout, args.seed)
+    print(f"Hid {sum(len(v) for v in hidden.values()) // 2} edges affecting {len(hidden)} users")
+
+    # Everything downstream only sees the training graph
+    social_network = create_social_network(train_profiles)
+    ml_model = MLModel(train_profiles, args.feature_set)
+    ml_model.train_model(classifier_type=args.classifier, max_pairs=args.max_pairs)
+    friend_recommendation = FriendRecommendation(social_network, train_profiles, ml_model)
+
+    users = sorted(hidden)
+    if args.max_queries and len(users) > args.max_queries:
+        users = sorted(random.Random(args.seed).sample(users, args.max_queries))
+
+    recommenders = build_recommenders(friend_recommendation)
+    if args.recommender:
+        recommenders = {name: recommenders[name] for name in args.recommender}
+    results = {name: evaluate(recommend, hidden, args.k, users) for name, recommend in recommenders.items()}
+    print_table(results, args.k)
+    with open(args.output, 'w') as f:
+        json.dump({'holdout': args.holdout, 'seed': args.seed, 'results': results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
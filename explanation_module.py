@@ -0,0 +1,95 @@
+from ml_module import FEATURE_SETS
+
+
+def feature_contributions(similarities, feature_names):
+    """{feature: points} adding up to friendship_probability(similarities)
+
+    Each feature contributes min(value, 1) / n * 100, which is exactly how the probability is formed.
+    """
+    n = len(similarities)
+    return {name: min(value, 1) / n * 100 for name, value in zip(feature_names, similarities)}
+
+
+class Explanation:
+    """Why candidate was recommended to user, built from what scoring already computed
+
+    The mutual friends are the set intersection calculate_similarity made for the count; shared
+    interests are kept as the ANDed bitmask and only turned into names when read.
+    """
+
+    __slots__ = ('user', 'candidate', 'probability', 'features', 'mutual_friends', '_interest_mask', '_encoder')
+
+    def __init__(self, user, candidate, probability, similarities, feature_names, mutual_friends, interest_mask,
+                 encoder):
+        self.user = user
+        self.candidate = candidate
+        self.probability = probability
+        self.features = dict(zip(feature_names, similarities))
+        self.mutual_friends = sorted(mutual_friends)
+        self._interest_mask = interest_mask
+        self._encoder = encoder
+
+    @classmethod
+    def from_details(cls, user, candidate, probability, similarities, details, ml_model):
+        # details is the dict calculate_similarity filled in for this pair
+        return cls(user, candidate, probability, similarities, ml_model.feature_names,
+                   details['common_friends'], details['interest_mask'], ml_model.encoder)
+
+    @property
+    def shared_interests(self):
+        return self._encoder.interests.decode(self._interest_mask)
+
+    @property
+    def contributions(self):
+        return feature_contributions(list(self.features.values()), list(self.features))
+
+    def to_dict(self):
+        return {
+            'user': self.user,
+            'candidate': self.candidate,
+            'probability': self.probability,
+            'mutual_friends': self.mutual_friends,
+            'shared_interests': self.shared_interests,
+            'features': self.features,
+            'contributions': self.contributions,
+        }
+
+    def summary(self, max_names=3):
+        # One line for the results panel, e.g. "Sara: 72% - 2 mutual (Ali, Omar); shares Music; same location"
+        parts = []
+        if self.mutual_friends:
+            names = ', '.join(self.mutual_friends[:max_names])
+            more = len(self.mutual_friends) - max_names
+            parts.append(f"{len(self.mutual_friends)} mutual ({names}{f' +{more}' if more > 0 else ''})")
+        interests = self.shared_interests
+        if interests:
+            parts.append(f"shares {', '.join(interests[:max_names])}")
+        if self.features.get('location_similarity'):
+            parts.append("same location")
+        if self.features.get('occupation_similarity'):
+            parts.append("same occupation")
+        return f"{self.candidate}: {self.probability:.0f}%" + (f" - {'; '.join(parts)}" if parts else "")
+
+
+def explanation_inputs(ml_model, user, candidate, profiles):
+    """(mutual friends, shared-interest mask) for a pair, the two things calculate_similarity's details hold
+
+    Saved next to scores computed elsewhere, they let an explanation be built later that still matches
+    the graph version the scores came from.
+    """
+    common = set(profiles[user]['friends']).intersection(profiles[candidate]['friends'])
+    encoder = ml_model.encoder
+    encoder.ensure(user)
+    encoder.ensure(candidate)
+    return tuple(common), encoder.interests.mask(user) & encoder.interests.mask(candidate)
+
+
+def explain_pair(ml_model, user, candidate, probability, similarities, profiles=None, inputs=None):
+    """Explanation for a pair whose scores came from elsewhere (a batch or a materialized view)
+
+    Uses saved explanation_inputs when given, otherwise redoes only the friend-set intersection and
+    the interest AND against profiles, not the scoring.
+    """
+    common, mask = inputs if inputs is not None else explanation_inputs(ml_model, user, candidate, profiles)
+    return Explanation(user, candidate, probability, similarities, FEATURE_SETS[ml_model.feature_set], common,
+                       mask, ml_model.encoder)
@@ -0,0 +1,221 @@
+import threading
+from collections.abc import MutableSet
+from types import MappingProxyType
+
+
+class FriendSet(MutableSet):
+    """Insertion-ordered set of friend names, used for user_profiles[...]['friends']
+
+    Backed by a dict, so membership, add and remove are O(1) while iteration keeps the CSV order.
+    append/remove/extend keep the list spelling the rest of the code already uses.
+    """
+
+    __slots__ = ('_items',)
+
+    def __init__(self, items=()):
+        self._items = dict.fromkeys(items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"FriendSet({list(self._items)!r})"
+
+    def add(self, item):
+        self._items[item] = None
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+    def remove(self, item):
+        del self._items[item]
+
+    def update(self, items):
+        self._items.update(dict.fromkeys(items))
+
+    def difference_update(self, items):
+        for item in items:
+            self._items.pop(item, None)
+
+    def copy(self):
+        return FriendSet(self._items)
+
+    append = add
+    extend = update
+
+
+class GraphSnapshot:
+    """Immutable social network + profiles at one version
+
+    Exposes the read-only part of the networkx Graph API that the search code uses, so readers can
+    hold on to a snapshot for a whole query without locks while writers publish newer versions.
+    """
+
+    __slots__ = ('version', '_adjacency', '_profiles', '_edge_count', 'profiles')
+
+    def __init__(self, version, adjacency, profiles, edge_count):
+        self.version = version
+        self._adjacency = adjacency  # node -> frozenset of neighbors
+        self._profiles = profiles  # user -> profile dict with 'friends' as a tuple
+        self._edge_count = edge_count
+        self.profiles = MappingProxyType(profiles)
+
+    def __contains__(self, node):
+        return node in self._adjacency
+
+    def __iter__(self):
+        return iter(self._adjacency)
+
+    def __len__(self):
+        return len(self._adjacency)
+
+    def nodes(self):
+        return self._adjacency.keys()
+
+    def neighbors(self, node):
+        return iter(self._adjacency[node])
+
+    def neighbor_set(self, node):
+        return self._adjacency[node]
+
+    def degree(self, node):
+        return len(self._adjacency[node])
+
+    def has_edge(self, a, b):
+        return b in self._adjacency.get(a, ())
+
+    def number_of_nodes(self):
+        return len(self._adjacency)
+
+    def number_of_edges(self):
+        return self._edge_count
+
+
+class GraphBatch:
+    """A set of edits that is published as one new snapshot when the `with` block exits"""
+
+    def __init__(self, store):
+        self.store = store
+        self.new_users = {}
+        self.edge_edits = []  # ('add' | 'remove', a, b) in the order they were made
+
+    def add_user(self, user, profile):
+        self.new_users[user] = profile
+
+    def add_edge(self, a, b):
+        self.edge_edits.append(('add', a, b))
+
+    def remove_edge(self, a, b):
+        self.edge_edits.append(('remove', a, b))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.store.commit(self)
+        return False
+
+
+class VersionedGraphStore:
+    """Copy-on-write store of GraphSnapshots
+
+    Writers serialize on a lock. A commit makes shallow copies of the node -> neighbors and user -> profile
+    dicts, which is O(N) in the number of users: about 75 ms at 1M users, however small the batch.
+    Only the touched neighbor sets and profiles are rebuilt, and the rest are shared with the old snapshot.
+    Many edits should therefore go in one batch(). Publishing the new snapshot is a single reference
+    assignment, so readers never see a half-applied batch.
+    """
+
+    def __init__(self, social_network, user_profiles):
+        adjacency = {node: frozenset(social_network.neighbors(node)) for node in social_network.nodes()}
+        profiles = {user: self._freeze_profile(profile) for user, profile in user_profiles.items()}
+        self._current = GraphSnapshot(0, adjacency, profiles, social_network.number_of_edges())
+        self._write_lock = threading.Lock()
+        self._listeners = []
+
+    @staticmethod
+    def _freeze_profile(profile, **updates):
+        frozen = dict(profile, **updates)
+        frozen['friends'] = tuple(frozen['friends'])
+        frozen['interests'] = tuple(frozen['interests'])
+        return frozen
+
+    def snapshot(self):
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def batch(self):
+        return GraphBatch(self)
+
+    def subscribe(self, callback):
+        # callback(snapshot, touched_users) runs on the writer's thread after each publish
+        self._listeners.append(callback)
+
+    def commit(self, batch):
+        with self._write_lock:
+            old = self._current
+            adjacency = dict(old._adjacency)
+            profiles = dict(old._profiles)
+            edge_count = old._edge_count
+            touched = set()
+
+            for user, profile in batch.new_users.items():
+                adjacency.setdefault(user, frozenset())
+                profiles[user] = self._freeze_profile(profile)
+                touched.add(user)
+
+            # Touched nodes get a private mutable copy; everything else is shared with the old snapshot.
+            # Friend lists are copied into insertion-ordered dicts so each edit in the batch is O(1).
+            neighbor_sets = {}
+            friend_lists = {}
+
+            def neighbors_of(node):
+                result = neighbor_sets.get(node)
+                if result is None:
+                    result = neighbor_sets[node] = set(adjacency.get(node, ()))
+                return result
+
+            def friends_of(user):
+                result = friend_lists.get(user)
+                if result is None and user in profiles:
+                    result = friend_lists[user] = dict.fromkeys(profiles[user]['friends'])
+                return result
+
+            for op, a, b in batch.edge_edits:
+                if a == b:
+                    continue
+                for node, other in ((a, b), (b, a)):
+                    friends = friends_of(node)
+                    if op == 'add':
+                        neighbors_of(node).add(other)
+                        if friends is not None:
+                            friends[other] = None
+                    else:
+                        neighbors_of(node).discard(other)
+                        if friends is not None:
+                            friends.pop(other, None)
+
+            degree_change = 0
+            for node, neighbors in neighbor_sets.items():
+                degree_change += len(neighbors) - len(adjacency.get(node, ()))
+                adjacency[node] = frozenset(neighbors)
+                touched.add(node)
+            for user, friends in friend_lists.items():
+                profiles[user] = self._freeze_profile(profiles[user], friends=friends)
+            edge_count += degree_change // 2
+
+            snapshot = GraphSnapshot(old.version + 1, adjacency, profiles, edge_count)
+            self._current = snapshot
+        for callback in self._listeners:
+            callback(snapshot, touched)
+        return snapshot
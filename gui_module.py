@@ -1,20 +1,23 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, colorchooser, filedialog
 import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tkinter import font as tkfont
 from datetime import datetime
 import csv
+from instrumentation_module import instrumentation, timed, stage
+from widgets_module import VirtualListbox
 
 class FriendRecommendationApp:
-    def __init__(self, root, ml_model, friend_recommendation):
+    def __init__(self, root, ml_model, friend_recommendation, profiles_path='user_profiles.csv'):
         self.root = root
         self.ml_model = ml_model
         self.friend_recommendation = friend_recommendation
+        self.profiles_path = profiles_path
+        self.training_error = None
         
         # Initialize highlighted node before update_graph is called
         self.highlighted_node = None
+        self.figure = None  # matplotlib Figure currently on screen
         
         # Add network metrics
         self.network_metrics = self.calculate_metrics()
@@ -61,7 +64,8 @@ class FriendRecommendationApp:
         
         self.setup_styles()
         self.create_gui()
-        self.update_graph()
+        # Draw the graph once the window is on screen (matplotlib is imported on first draw)
+        self.root.after_idle(self.update_graph)
         
         # Add keyboard shortcuts
         self.root.bind('<Control-f>', lambda e: self.user_entry.focus())
@@ -122,6 +126,16 @@ class FriendRecommendationApp:
         export_menu.add_command(label="Save Graph as PNG", command=self.export_graph)
         export_menu.add_command(label="Export Results as CSV", command=self.export_results)
 
+        # Performance menu (instrumentation and profiling)
+        self.instrumentation_var = tk.BooleanVar(value=instrumentation.enabled)
+        perf_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Performance", menu=perf_menu)
+        perf_menu.add_checkbutton(label="Enable Stage Timers", variable=self.instrumentation_var,
+                                  command=self.toggle_instrumentation)
+        perf_menu.add_command(label="Start/Stop Profiling Capture", command=self.toggle_profiling_capture)
+        perf_menu.add_command(label="Show Performance Stats", command=self.show_performance_stats)
+        perf_menu.add_command(label="Reset Stats", command=instrumentation.reset)
+
     def show_add_user_dialog(self):
         dialog = tk.Toplevel(self.root)
         dialog.title("Add New User")
@@ -174,8 +188,7 @@ class FriendRecommendationApp:
             }
             
             # Update data structures
-            self.friend_recommendation.user_profiles[username] = new_user
-            self.friend_recommendation.social_network.add_node(username)
+            self.friend_recommendation.add_user(username, new_user)
             
             # Update visualization
             self.update_graph()
@@ -273,13 +286,14 @@ class FriendRecommendationApp:
         )
         search_frame.grid(row=1, column=0, sticky="ew", pady=(0, 20))
         
-        # Search input
-        self.user_entry = ttk.Entry(
+        # Search input, with name completions in the dropdown
+        self.user_entry = ttk.Combobox(
             search_frame,
             font=self.normal_font,
             width=30
         )
         self.user_entry.grid(row=0, column=0, padx=5, pady=8)
+        self.attach_autocomplete(self.user_entry)
         
         # Search button
         self.search_btn = ttk.Button(
@@ -441,6 +455,35 @@ class FriendRecommendationApp:
         )
         layout_combo.pack(side="left", padx=5)
         layout_combo.bind('<<ComboboxSelected>>', self.update_graph)
+
+        # Ego view: draw only the highlighted user's neighborhood and recommendations
+        self.ego_view_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            controls_frame,
+            text="Ego View",
+            variable=self.ego_view_var,
+            command=self.update_graph
+        ).pack(side="left", padx=5)
+
+        ttk.Label(
+            controls_frame,
+            text="Hops:",
+            style='Normal.TLabel'
+        ).pack(side="left", padx=5)
+
+        self.ego_hops_var = tk.StringVar(value="1")
+        ego_hops_spinbox = ttk.Spinbox(
+            controls_frame,
+            from_=1,
+            to=3,
+            increment=1,
+            textvariable=self.ego_hops_var,
+            width=3,
+            command=self.update_graph,
+            font=self.normal_font
+        )
+        ego_hops_spinbox.pack(side="left", padx=5)
+        ego_hops_spinbox.bind('<Return>', lambda e: self.update_graph())
         
         # Refresh button
         ttk.Button(
@@ -474,10 +517,16 @@ class FriendRecommendationApp:
         self.add_graph_search()
         self.add_quick_actions()
 
+    @timed('render.update_graph')
     def update_graph(self, *args):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from render_module import compute_layout, draw_network, node_colors
+
         # Clear previous graph
         for widget in self.graph_frame.winfo_children():
             widget.destroy()
+        self.figure = None
             
         try:
             # Get current zoom and node size values
@@ -497,46 +546,29 @@ class FriendRecommendationApp:
                 self._warning_shown = True
             
             node_size = float(self.node_size_var.get())
+
+            # Whole network, or just the highlighted user's neighborhood in ego view
+            with stage('render.ego_extract'):
+                graph, scores = self.graph_to_draw()
                 
             # Get selected layout
-            layout_type = self.layout_var.get()
-            if layout_type == "spring":
-                pos = nx.spring_layout(self.friend_recommendation.social_network, k=1.5, iterations=50)
-            elif layout_type == "circular":
-                pos = nx.circular_layout(self.friend_recommendation.social_network)
-            elif layout_type == "random":
-                pos = nx.random_layout(self.friend_recommendation.social_network)
-            elif layout_type == "shell":
-                pos = nx.shell_layout(self.friend_recommendation.social_network)
+            pos = compute_layout(graph, self.layout_var.get())
                 
-            # Create new graph with current size
-            fig, ax = plt.subplots(figsize=(8 * zoom, 6 * zoom))
-            
-            # Update node colors based on highlighted node
-            node_colors = [
-                '#FF0000' if node == self.highlighted_node else self.node_color.get()
-                for node in self.friend_recommendation.social_network.nodes()
-            ]
-            
-            nx.draw(
-                self.friend_recommendation.social_network,
-                pos,
-                with_labels=True,
-                node_color=node_colors,  # Use node_colors instead of single color
-                node_size=node_size * zoom,  # Use node_size variable
-                font_size=8 * zoom,
-                font_weight='bold',
-                edge_color=self.edge_color.get(),
-                width=1.5,
-                ax=ax
-            )
-            
-            plt.title("Social Network Graph", pad=20, fontsize=14)
-            plt.tight_layout()
+            # Create new graph with current size. A plain Figure, not plt.subplots: pyplot keeps every
+            # figure it creates alive until plt.close, so each redraw used to leak the previous one
+            fig = Figure(figsize=(8 * zoom, 6 * zoom))
             
+            # Update node colors based on highlighted node; recommended candidates are shaded by score
+            colors = node_colors(graph, self.highlighted_node, scores, self.node_color.get())
+            title = f"Ego Network of {self.highlighted_node}" if graph is not self.friend_recommendation.social_network \
+                else "Social Network Graph"
             # Create canvas with better size management
             canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-            canvas.draw()
+            draw_network(fig, graph, pos, colors, title, zoom, node_size, self.edge_color.get())
+            fig.tight_layout()
+            with stage('render.canvas'):
+                canvas.draw()
+            self.figure = fig  # What export_graph saves
             
             # Pack canvas with expansion
             canvas_widget = canvas.get_tk_widget()
@@ -555,6 +587,10 @@ class FriendRecommendationApp:
                 if event.inaxes:
                     for node, (x, y) in pos.items():
                         if abs(event.xdata - x) < 0.02 and abs(event.ydata - y) < 0.02:
+                            if self.ego_view_var.get():
+                                # Re-center the ego view on the clicked user, outside this canvas callback
+                                self.highlighted_node = node
+                                self.root.after_idle(self.update_graph)
                             self.show_user_info(node)
                             return  # Exit after first match
             
@@ -577,14 +613,30 @@ class FriendRecommendationApp:
             self.zoom_var.set("0.6")
             self.node_size_var.set("2000")
 
+    def graph_to_draw(self):
+        # Returns (graph, {candidate: score}); candidates are only scored once the model is ready, and
+        # only for a user with a profile (a name known only from an edge list is drawn without scores)
+        user = self.highlighted_node
+        if not self.ego_view_var.get() or user is None or user not in self.friend_recommendation.social_network:
+            return self.friend_recommendation.social_network, {}
+        recommendations = []
+        if self.ml_model.is_trained and user in self.friend_recommendation.snapshot().profiles:
+            recommendations = self.friend_recommendation.cached_recommendations(user)[:20]
+        hops = max(1, int(self.ego_hops_var.get()))
+        ego = self.friend_recommendation.ego_network(user, hops, recommendations)
+        return ego, {name: probability for name, (probability, _) in recommendations}
+
     def recommend(self):
         user = self.user_entry.get().strip()
         if not user:
             messagebox.showwarning("Input Error", "Please enter a username")
             return
             
-        if user not in self.friend_recommendation.social_network:
-            messagebox.showerror("Error", f"User '{user}' not found in the network")
+        user = self.resolve_username(user)
+        if user is None:
+            return
+
+        if not self.model_ready():
             return
             
         # Add to history
@@ -595,17 +647,50 @@ class FriendRecommendationApp:
         # Update status
         self.status_var.set(f"Finding recommendations for {user}...")
         
-        # Find recommendations
-        recommendations = self.friend_recommendation.find_recommendations(user)
+        # Find recommendations (read from the materialized view when main.py enabled it)
+        explanations = {}
+        recommendations = self.friend_recommendation.cached_recommendations(user, explanations)
         
         if recommendations:
-            rec_list = [name for name, _ in recommendations]
-            self.result_var.set(f"Recommendations for {user}:\n{', '.join(rec_list)}")
+            # The best few with why they were picked, then the rest by name
+            lines = [explanations[name].summary() for name, _ in recommendations[:5]]
+            rest = [name for name, _ in recommendations[5:]]
+            if rest:
+                lines.append(f"Also: {', '.join(rest)}")
+            self.result_var.set(f"Recommendations for {user}:\n" + '\n'.join(lines))
         else:
             self.result_var.set(f"No recommendations found for {user}")
+
+        if self.ego_view_var.get():
+            # Show the user's neighborhood with the candidates shaded by score
+            self.highlighted_node = user
+            self.update_graph()
             
         self.status_var.set("Ready")
         
+    def attach_autocomplete(self, combobox):
+        # Offer prefix completions from the name index in the combobox dropdown as the user types
+        def update_completions(event):
+            if event.keysym in ('Up', 'Down', 'Return', 'Escape'):
+                return
+            combobox['values'] = self.friend_recommendation.get_name_index().complete(combobox.get(), limit=15)
+
+        combobox.bind('<KeyRelease>', update_completions)
+
+    def resolve_username(self, name):
+        # Exact match, or offer the closest existing name when the entered one has a typo
+        if name in self.friend_recommendation.social_network:
+            return name
+        suggestions = self.friend_recommendation.get_name_index().suggest(name)
+        if not suggestions:
+            messagebox.showerror("Error", f"User '{name}' not found in the network")
+            return None
+        best = suggestions[0][0]
+        message = f"User '{name}' not found. Did you mean '{best}'?"
+        if len(suggestions) > 1:
+            message += "\n\nOther close matches: " + ', '.join(other for other, _ in suggestions[1:])
+        return best if messagebox.askyesno("User Not Found", message) else None
+
     def on_history_select(self, event):
         selection = self.history_listbox.curselection()
         if selection:
@@ -659,15 +744,20 @@ class FriendRecommendationApp:
             filename = filedialog.asksaveasfilename(
                 defaultextension=".png",
                 initialfile=f"social_network_{timestamp}.png",
-                filetypes=[("PNG files", "*.png")]
+                filetypes=[("PNG files", "*.png"), ("SVG files", "*.svg")]
             )
             if filename:
-                plt.savefig(filename, dpi=300, bbox_inches='tight')
+                if self.figure is None:
+                    raise ValueError("the graph has not been drawn yet")
+                # The figure on screen, not pyplot's current figure; the format follows the extension
+                self.figure.savefig(filename, dpi=300, bbox_inches='tight')
                 messagebox.showinfo("Success", "Graph exported successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export graph: {str(e)}")
 
     def export_results(self):
+        if not self.model_ready():
+            return
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = filedialog.asksaveasfilename(
@@ -679,15 +769,41 @@ class FriendRecommendationApp:
                 with open(filename, 'w', newline='') as csvfile:
                     writer = csv.writer(csvfile)
                     writer.writerow(['Timestamp', 'User', 'Recommendations'])
-                    for entry in self.search_history:
-                        timestamp, user = entry.split(" - ")
-                        recommendations = self.friend_recommendation.find_recommendations(user)
-                        rec_list = [name for name, _ in recommendations]
+                    entries = [entry.split(" - ") for entry in self.search_history]
+                    # One batched query for every user in the history
+                    results = self.friend_recommendation.find_recommendations_batch([user for _, user in entries])
+                    for timestamp, user in entries:
+                        rec_list = [name for name, _ in results[user]]
                         writer.writerow([timestamp, user, ", ".join(rec_list)])
                 messagebox.showinfo("Success", "Results exported successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export results: {str(e)}")
 
+    def start_background_training(self, classifier_type, artifact_dir=None):
+        self.status_var.set(f"Loading {classifier_type} model in the background...")
+
+        def on_done(error):
+            # Runs on the training thread; check_training picks this up on the Tk thread
+            self.training_error = error
+
+        self.ml_model.train_model_async(classifier_type, on_done=on_done, artifact_dir=artifact_dir)
+        self.root.after(200, self.check_training)
+
+    def check_training(self):
+        if self.training_error is not None:
+            self.status_var.set("Model training failed")
+            messagebox.showerror("Error", f"Failed to train model: {self.training_error}")
+        elif self.ml_model.is_trained:
+            self.status_var.set("Model ready")
+        else:
+            self.root.after(200, self.check_training)
+
+    def model_ready(self):
+        if self.ml_model.is_trained:
+            return True
+        messagebox.showinfo("Please Wait", "The recommendation model is still training.\nTry again in a moment.")
+        return False
+
     def change_theme(self, theme_name):
         if theme_name not in self.themes:
             return
@@ -809,8 +925,9 @@ class FriendRecommendationApp:
         search_frame.grid(row=3, column=0, sticky="ew", pady=5)
         
         ttk.Label(search_frame, text="Find User:").pack(side="left", padx=5)
-        self.search_entry = ttk.Entry(search_frame)
+        self.search_entry = ttk.Combobox(search_frame)
         self.search_entry.pack(side="left", padx=5)
+        self.attach_autocomplete(self.search_entry)
         
         def find_user():
             username = self.search_entry.get().strip()
@@ -818,8 +935,8 @@ class FriendRecommendationApp:
                 messagebox.showwarning("Search Error", "Please enter a username")
                 return
                 
-            if username not in self.friend_recommendation.social_network:
-                messagebox.showerror("Error", f"User '{username}' not found")
+            username = self.resolve_username(username)
+            if username is None:
                 return
                 
             self.highlighted_node = username
@@ -918,12 +1035,11 @@ class FriendRecommendationApp:
         mutual_friends = set(self.friend_recommendation.user_profiles[user1]['friends']) & \
                         set(self.friend_recommendation.user_profiles[user2]['friends'])
         
-        shared_interests = set(self.friend_recommendation.user_profiles[user1]['interests']) & \
-                          set(self.friend_recommendation.user_profiles[user2]['interests'])
+        shared_interests = self.ml_model.encoder.shared_interests(user1, user2)
         
         comparison = f"Comparison Results:\n\n" \
                     f"Mutual Friends: {len(mutual_friends)}\n" \
-                    f"Shared Interests: {len(shared_interests)}\n" \
+                    f"Shared Interests: {shared_interests}\n" \
                     f"Same Location: {'Yes' if self.friend_recommendation.user_profiles[user1]['location'] == self.friend_recommendation.user_profiles[user2]['location'] else 'No'}"
         
         messagebox.showinfo("User Comparison", comparison)
@@ -961,70 +1077,52 @@ class FriendRecommendationApp:
         current_frame = ttk.LabelFrame(dialog, text="Current Connections")
         current_frame.pack(pady=5, padx=5, fill="x")
         
-        current_listbox = tk.Listbox(current_frame, selectmode=tk.MULTIPLE, height=5)
-        current_listbox.pack(pady=5, fill="x")
-        
-        # Populate current connections
+        # Both lists are virtualized and filtered as you type, so the dialog opens instantly on large networks
+        name_index = self.friend_recommendation.get_name_index()
         current_friends = self.friend_recommendation.user_profiles[username]['friends']
-        for friend in current_friends:
-            current_listbox.insert(tk.END, friend)
+
+        def current_rows(query):
+            query = query.strip().lower()
+            return (friend for friend in current_friends if query in friend.lower())
+
+        def available_rows(query):
+            # current_friends is a FriendSet, so each check is O(1)
+            return (user for user in name_index.matches(query) if user != username and user not in current_friends)
+
+        current_listbox = VirtualListbox(current_frame, current_rows, selectmode=tk.MULTIPLE, height=5)
+        current_listbox.pack(pady=5, fill="x")
         
         # Available users frame
         available_frame = ttk.LabelFrame(dialog, text="Available Users")
         available_frame.pack(pady=5, padx=5, fill="both", expand=True)
         
-        available_listbox = tk.Listbox(available_frame, selectmode=tk.MULTIPLE, height=10)
+        available_listbox = VirtualListbox(available_frame, available_rows, selectmode=tk.MULTIPLE, height=10)
         available_listbox.pack(pady=5, fill="both", expand=True)
         
-        # Populate available users (excluding current connections)
-        for user in self.friend_recommendation.social_network.nodes():
-            if user != username and user not in current_friends:
-                available_listbox.insert(tk.END, user)
-        
+        def refresh_lists():
+            for listbox in (current_listbox, available_listbox):
+                listbox.clear_selection()
+                listbox.refresh()
+
         def remove_connections():
-            selected = [current_listbox.get(idx) for idx in current_listbox.curselection()]
+            selected = current_listbox.selection()
             if not selected:
                 messagebox.showwarning("Warning", "Please select connections to remove")
                 return
                 
-            for friend in selected:
-                # Remove bidirectional connection
-                self.friend_recommendation.social_network.remove_edge(username, friend)
-                
-                # Update both users' profiles
-                self.friend_recommendation.user_profiles[username]['friends'].remove(friend)
-                self.friend_recommendation.user_profiles[friend]['friends'].remove(username)
-                
-                # Move to available list
-                current_listbox.delete(0, tk.END)
-                available_listbox.insert(tk.END, friend)
-                
-                # Refresh current connections list
-                for f in self.friend_recommendation.user_profiles[username]['friends']:
-                    current_listbox.insert(tk.END, f)
+            # Remove bidirectional connections and update both users' profiles as one version
+            self.friend_recommendation.remove_friends(username, selected)
+            refresh_lists()
         
         def add_connections():
-            selected = [available_listbox.get(idx) for idx in available_listbox.curselection()]
+            selected = available_listbox.selection()
             if not selected:
                 messagebox.showwarning("Warning", "Please select users to connect with")
                 return
                 
-            for friend in selected:
-                # Add bidirectional connection
-                self.friend_recommendation.social_network.add_edge(username, friend)
-                
-                # Update both users' profiles
-                self.friend_recommendation.user_profiles[username]['friends'].append(friend)
-                self.friend_recommendation.user_profiles[friend]['friends'].append(username)
-                
-                # Move to current list
-                available_listbox.delete(0, tk.END)
-                current_listbox.insert(tk.END, friend)
-                
-                # Refresh available users list
-                for user in self.friend_recommendation.social_network.nodes():
-                    if user != username and user not in self.friend_recommendation.user_profiles[username]['friends']:
-                        available_listbox.insert(tk.END, user)
+            # Add bidirectional connections and update both users' profiles as one version
+            self.friend_recommendation.add_friends(username, selected)
+            refresh_lists()
         
         # Buttons
         button_frame = ttk.Frame(dialog)
@@ -1034,6 +1132,49 @@ class FriendRecommendationApp:
         ttk.Button(button_frame, text="Add Selected", command=add_connections).pack(side="left", padx=5)
         ttk.Button(button_frame, text="Save Changes", command=lambda: self.save_changes(dialog)).pack(side="left", padx=5)
 
+    def toggle_instrumentation(self):
+        instrumentation.enabled = self.instrumentation_var.get()
+        self.status_var.set(f"Stage timers {'enabled' if instrumentation.enabled else 'disabled'}")
+
+    def toggle_profiling_capture(self):
+        if instrumentation.capturing:
+            report = instrumentation.stop_capture()
+            self.show_text_window("Profiling Capture", report)
+            self.status_var.set("Profiling capture stopped")
+        else:
+            instrumentation.start_capture(cprofile=True, trace_memory=True)
+            self.instrumentation_var.set(True)
+            self.status_var.set("Profiling capture running (cProfile + tracemalloc)...")
+
+    def show_performance_stats(self):
+        if not instrumentation.stages:
+            messagebox.showinfo("Performance Stats",
+                                "No stats recorded yet.\n"
+                                "Enable stage timers from the Performance menu or set FRS_PROFILE=1.")
+            return
+        window = self.show_text_window("Performance Stats", instrumentation.report())
+
+        def save_stats():
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("JSON files", "*.json")]
+            )
+            if filename:
+                instrumentation.dump(filename)
+
+        ttk.Button(window, text="Save as JSON", command=save_stats).pack(pady=5)
+
+    def show_text_window(self, title, text):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("800x600")
+        window.transient(self.root)
+        text_widget = tk.Text(window, font=("Courier", 10), wrap="none")
+        text_widget.insert("1.0", text)
+        text_widget.config(state="disabled")
+        text_widget.pack(fill="both", expand=True)
+        return window
+
     def save_changes(self, dialog):
         self.update_csv_file()
         self.update_graph()
@@ -1041,7 +1182,7 @@ class FriendRecommendationApp:
         messagebox.showinfo("Success", "Connections updated successfully!")
 
     def update_csv_file(self):
-        with open('/Users/karem/Documents/GitHub/Friends_Recommendation_System/user_profiles.csv', 'w', newline='') as file:
+        with open(self.profiles_path, 'w', newline='') as file:
             writer = csv.DictWriter(file, fieldnames=['name', 'interests', 'friends', 'age', 'location', 'occupation', 'activities'])
             writer.writeheader()
             
@@ -1064,20 +1205,18 @@ class FriendRecommendationApp:
         
         ttk.Label(dialog, text="Select a user to manage connections:").pack(pady=5)
         
-        # User listbox
-        users_listbox = tk.Listbox(dialog, height=10)
-        users_listbox.pack(pady=5, fill=tk.BOTH, expand=True)
-        
-        # Populate users
-        for user in sorted(self.friend_recommendation.social_network.nodes()):
-            users_listbox.insert(tk.END, user)
+        # User listbox, virtualized and searchable
+        users_listbox = VirtualListbox(dialog, self.friend_recommendation.get_name_index().matches, height=10)
+        users_listbox.pack(pady=5, padx=5, fill=tk.BOTH, expand=True)
         
         def on_select():
-            if not users_listbox.curselection():
+            if not users_listbox.selection():
                 messagebox.showwarning("Warning", "Please select a user")
                 return
-            username = users_listbox.get(users_listbox.curselection())
+            username = users_listbox.selection()[0]
             dialog.destroy()
             self.manage_connections(username)
         
+        users_listbox.listbox.bind('<Double-Button-1>', lambda e: on_select())
+        users_listbox.search_entry.focus_set()
         ttk.Button(dialog, text="Manage Connections", command=on_select).pack(pady=10)
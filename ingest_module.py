@@ -0,0 +1,254 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import time
+
+from graph_store_module import FriendSet
+from instrumentation_module import timed
+
+PROFILE_FIELDS = ('name', 'interests', 'friends', 'age', 'location', 'occupation', 'activities')
+
+
+class IngestReport:
+    """Counts from one ingestion run, plus the first few malformed rows with their line numbers"""
+
+    def __init__(self, max_samples=20):
+        self.max_samples = max_samples
+        self.rows = 0
+        self.profiles = 0
+        self.edges_read = 0
+        self.edges_added = 0
+        self.self_loops = 0
+        self.unknown = 0  # Edges dropped because an endpoint has no profile
+        self.unknown_users = []  # The first few such names
+        self.malformed = 0
+        self.samples = []  # (source, line number, reason, text)
+
+    @property
+    def duplicates(self):
+        # Repeated edges, including the second direction of an edge listed both ways
+        return self.edges_read - self.self_loops - self.unknown - self.edges_added
+
+    def unknown_edge(self, names):
+        self.unknown += 1
+        for name in names:
+            if len(self.unknown_users) < self.max_samples and name not in self.unknown_users:
+                self.unknown_users.append(name)
+
+    def malformed_row(self, source, line_number, reason, text):
+        self.malformed += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append((source, line_number, reason, text[:200]))
+
+    def __str__(self):
+        lines = [f"{self.rows} rows, {self.profiles} profiles, {self.edges_read} edges read, "
+                 f"{self.edges_added} added, {self.duplicates} duplicates, {self.self_loops} self-loops, "
+                 f"{self.unknown} without a profile, {self.malformed} malformed"]
+        if self.unknown:
+            more = ', ...' if self.unknown > len(self.unknown_users) else ''
+            lines.append(f"  edges dropped, no profile for: {', '.join(self.unknown_users)}{more}")
+        for source, line_number, reason, text in self.samples:
+            lines.append(f"  {os.path.basename(source)}:{line_number}: {reason}: {text!r}")
+        if self.malformed > len(self.samples):
+            lines.append(f"  ... {self.malformed - len(self.samples)} more")
+        return '\n'.join(lines)
+
+
+def open_text(path):
+    # Text stream over path, gunzipped on the fly when the file starts with the gzip magic bytes
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    if gzipped:
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def source_format(path):
+    # 'csv', 'jsonl' or 'edges', from the file name with any .gz suffix removed
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    return 'edges'
+
+
+def profile_format(path):
+    # 'csv' or 'jsonl'; anything else (an edge list passed as --profiles) is rejected before reading
+    fmt = source_format(path)
+    if fmt == 'edges':
+        raise ValueError(f"{path} is not a profile file (.csv, .jsonl, .ndjson or .json, optionally .gz); "
+                         f"pass edge lists with --edges")
+    return fmt
+
+
+def csv_path_for(path):
+    # Where profiles read from a non-CSV source are saved back as CSV
+    name = path[:-3] if path.endswith('.gz') else path
+    return os.path.splitext(name)[0] + '.csv'
+
+
+def _profile(record):
+    # Same normalization as main.load_user_profiles; list-valued fields may also come as JSON arrays
+    def as_list(value):
+        return list(value) if isinstance(value, list) else [item for item in str(value).split(', ') if item]
+
+    missing = [field for field in PROFILE_FIELDS if record.get(field) in (None, '') and field != 'friends']
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    activities = record['activities']
+    return str(record['name']), {
+        'interests': as_list(record['interests']),
+        'friends': FriendSet(as_list(record.get('friends') or [])),
+        'age': int(record['age']),
+        'location': record['location'],
+        'occupation': record['occupation'],
+        'activities': ', '.join(activities) if isinstance(activities, list) else activities,
+    }
+
+
+def iter_profiles(path, report):
+    """(name, profile) for every valid row of a CSV or JSONL profile file, read one line at a time"""
+    fmt = profile_format(path)
+    with open_text(path) as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            rows = ((reader.line_num, row, ','.join(str(value) for value in row.values())) for row in reader)
+        else:
+            rows = ((line_number, line, line) for line_number, line in enumerate(f, 1) if line.strip())
+        for line_number, row, text in rows:
+            report.rows += 1
+            try:
+                if fmt != 'csv':
+                    row = json.loads(row)
+                    if not isinstance(row, dict):
+                        raise ValueError("not a JSON object")
+                name, profile = _profile(row)
+            except (ValueError, TypeError, KeyError) as e:
+                report.malformed_row(path, line_number, str(e) or type(e).__name__, text.strip())
+                continue
+            report.profiles += 1
+            yield name, profile
+
+
+def iter_edges(path, report):
+    """(a, b) for every line of an edge list: two names separated by a tab, a comma or else whitespace
+
+    Blank lines and lines starting with '#' are skipped; columns after the second (weights) are ignored.
+    """
+    with open_text(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            report.rows += 1
+            separator = '\t' if '\t' in line else ',' if ',' in line else None
+            fields = [field.strip() for field in line.split(separator)]
+            if len(fields) < 2 or not fields[0] or not fields[1]:
+                report.malformed_row(path, line_number, "expected two names", line)
+                continue
+            yield fields[0], fields[1]
+
+
+@timed('ingest.add_edges')
+def add_edges(graph, edges, report, user_profiles=None, chunk_size=100000, known=None):
+    """Inserts edges into graph chunk by chunk with add_edges_from, skipping self-loops and duplicates
+
+    Edges are canonicalized as (min, max), so a -> b and b -> a count once; only one chunk is held
+    besides the graph itself. With user_profiles, both endpoints' friend sets are updated as well.
+    An edge naming a user not in known (default user_profiles) is dropped and counted in
+    report.unknown: the search scores every candidate it reaches, so a node without a profile
+    would make queries fail.
+    """
+    known = user_profiles if known is None else known
+    chunk = {}  # Used as an insertion-ordered set, so the graph's edge order follows the input
+
+    def flush():
+        new = [edge for edge in chunk if not graph.has_edge(*edge)]
+        graph.add_edges_from(new)
+        if user_profiles is not None:
+            for a, b in new:
+                user_profiles[a]['friends'].add(b)
+                user_profiles[b]['friends'].add(a)
+        report.edges_added += len(new)
+        chunk.clear()
+
+    for a, b in edges:
+        report.edges_read += 1
+        if a == b:
+            report.self_loops += 1
+            continue
+        if known is not None and (a not in known or b not in known):
+            report.unknown_edge(name for name in (a, b) if name not in known)
+            continue
+        chunk[(a, b) if a < b else (b, a)] = None
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return report
+
+
+@timed('ingest.load_network')
+def load_network(profiles_path=None, edges_path=None, chunk_size=100000, report=None):
+    """(user_profiles, social_network, report) from a profile file and/or an edge list, any of them gzipped
+
+    Friends listed in the profiles and edges from the edge list go through the same deduplicating
+    chunked insert. With profiles, edges to users without one are dropped and reported, whether they
+    come from a friend list or the edge list; an edge list alone gives a graph whose users have no profiles.
+    """
+    import networkx as nx
+
+    report = report or IngestReport()
+    user_profiles = {}
+    social_network = nx.Graph()
+    if profiles_path:
+        for name, profile in iter_profiles(profiles_path, report):
+            user_profiles[name] = profile
+            social_network.add_node(name)
+        # Friends are added once every profile is read, so a friend listed before their own row is known.
+        # Friend lists stay as listed, like main.load_user_profiles; the graph gets each edge once
+        friend_edges = ((name, friend) for name, profile in user_profiles.items() for friend in profile['friends'])
+        add_edges(social_network, friend_edges, report, chunk_size=chunk_size, known=user_profiles)
+    if edges_path:
+        add_edges(social_network, iter_edges(edges_path, report), report,
+                  user_profiles if profiles_path else None, chunk_size)
+    return user_profiles, social_network, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load profiles and edges from CSV, JSONL or edge-list files")
+    parser.add_argument('--profiles', help="profiles as .csv or .jsonl, optionally .gz")
+    parser.add_argument('--edges', help="edge list, one 'a b' pair per line, optionally .gz")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="edges per add_edges_from call")
+    parser.add_argument('--save-csv', help="write the loaded profiles in the main CSV format")
+    args = parser.parse_args(argv)
+    if not args.profiles and not args.edges:
+        parser.error("give --profiles and/or --edges")
+    if args.profiles:
+        try:
+            profile_format(args.profiles)
+        except ValueError as e:
+            parser.error(str(e))
+
+    start = time.perf_counter()
+    user_profiles, social_network, report = load_network(args.profiles, args.edges, args.chunk_size)
+    print(f"Loaded {social_network.number_of_nodes()} nodes and {social_network.number_of_edges()} edges "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(report)
+    if args.save_csv:
+        with open(args.save_csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(PROFILE_FIELDS))
+            writer.writeheader()
+            for name, profile in user_profiles.items():
+                writer.writerow({'name': name, 'interests': ', '.join(profile['interests']),
+                                 'friends': ', '.join(profile['friends']), 'age': profile['age'],
+                                 'location': profile['location'], 'occupation': profile['occupation'],
+                                 'activities': profile['activities']})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import atexit
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# FRS_PROFILE=1 enables stage timers; add "cprofile" and/or "tracemalloc" to also capture those,
+# e.g. FRS_PROFILE=cprofile,tracemalloc. FRS_PROFILE_OUT=<file.json> dumps the stats at exit.
+ENV_VAR = 'FRS_PROFILE'
+ENV_OUTPUT = 'FRS_PROFILE_OUT'
+
+
+class StageStats:
+    """Latency stats for one named stage, with power-of-two microsecond buckets"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        # Bucket b holds latencies in [2**(b-1), 2**b) microseconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'min_ms': self.min * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'histogram_us': {f"<{2 ** b}": n for b, n in sorted(self.buckets.items())},
+        }
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.tracing_memory = False
+
+    def record(self, name, seconds):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def start_capture(self, cprofile=True, trace_memory=True):
+        self.enabled = True
+        if cprofile and self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing_memory = True
+
+    def stop_capture(self, limit=25):
+        # Stops cProfile/tracemalloc and returns their reports as text
+        out = io.StringIO()
+        if self.profiler is not None:
+            self.profiler.disable()
+            out.write("=== cProfile (cumulative) ===\n")
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+            self.profiler = None
+        if self.tracing_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.tracing_memory = False
+            out.write(f"=== tracemalloc (current {current / 1024 ** 2:.1f} MB, peak {peak / 1024 ** 2:.1f} MB) ===\n")
+            for stat in snapshot.statistics('lineno')[:limit]:
+                out.write(f"{stat}\n")
+        return out.getvalue()
+
+    @property
+    def capturing(self):
+        return self.profiler is not None or self.tracing_memory
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'stages': {name: stats.to_dict() for name, stats in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self):
+        data = self.snapshot()
+        lines = [f"{'stage':<32}{'count':>8}{'mean ms':>11}{'max ms':>11}{'total s':>10}"]
+        for name, s in sorted(data['stages'].items(), key=lambda item: -item[1]['total_s']):
+            lines.append(f"{name:<32}{s['count']:>8}{s['mean_ms']:>11.3f}{s['max_ms']:>11.3f}{s['total_s']:>10.3f}")
+            peak = max(s['histogram_us'].values())
+            for bucket, n in s['histogram_us'].items():
+                bar = '#' * max(1, round(n / peak * 30))
+                lines.append(f"    {bucket + ' us':>12} {bar} {n}")
+        if data['counters']:
+            lines.append("")
+            lines.append("counters:")
+            for name, value in sorted(data['counters'].items()):
+                lines.append(f"    {name:<28}{value:>12}")
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        instrumentation.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+instrumentation = Instrumentation()
+
+
+def timed(name):
+    # Decorator that records the wrapped call under `name`; one attribute check when disabled
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                instrumentation.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def stage(name):
+    # Context manager version of timed() for sections inside a function
+    return _Stage(name) if instrumentation.enabled else _NULL_STAGE
+
+
+def count(name, n=1):
+    instrumentation.count(name, n)
+
+
+def _configure_from_env():
+    value = os.environ.get(ENV_VAR, '').strip().lower()
+    if not value or value in ('0', 'false', 'off'):
+        return
+    options = {option.strip() for option in value.split(',')}
+    instrumentation.enabled = True
+    if 'cprofile' in options or 'tracemalloc' in options:
+        instrumentation.start_capture(cprofile='cprofile' in options,
+                                      trace_memory='tracemalloc' in options)
+    atexit.register(_dump_at_exit)
+
+
+def _dump_at_exit():
+    capture = instrumentation.stop_capture() if instrumentation.capturing else ""
+    output = os.environ.get(ENV_OUTPUT)
+    if output:
+        instrumentation.dump(output)
+        if capture:
+            with open(os.path.splitext(output)[0] + '_capture.txt', 'w') as f:
+                f.write(capture)
+    else:
+        sys.stderr.write(instrumentation.report() + "\n" + capture)
+
+
+_configure_from_env()
@@ -1,10 +1,18 @@
-import tkinter as tk
-from gui_module import FriendRecommendationApp
-from ml_module import MLModel
-from search_module import FriendRecommendation
+import time
+_process_start = time.perf_counter()  # Reference point for time-to-first-window
+
+import argparse
+import os
 import csv
 import networkx as nx
+from instrumentation_module import timed
+from artifact_module import ARTIFACT_DIR
+from graph_store_module import FriendSet
+from ingest_module import profile_format
+
+PROFILES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'user_profiles.csv')
 
+@timed('load.load_user_profiles')
 def load_user_profiles(filename):
     user_profiles = {}
     with open(filename, 'r') as csvfile:
@@ -12,7 +20,7 @@ def load_user_profiles(filename):
         for row in reader:
             name = row['name']
             interests = row['interests'].split(', ')
-            friends = row['friends'].split(', ')
+            friends = FriendSet(row['friends'].split(', '))
             age = int(row['age'])
             location = row['location']
             occupation = row['occupation']
@@ -26,24 +34,71 @@ def load_user_profiles(filename):
                 'activities': activities
             } # Add the user profile to the dictionary with the name as the key for easy access
     return user_profiles
+@timed('load.create_social_network')
 def create_social_network(user_profiles):
     social_network = nx.Graph()
-    for user, profile in user_profiles.items():
-        for friend in profile['friends']:
-            social_network.add_edge(user, friend)
+    # One bulk insert instead of an add_edge call per friendship
+    social_network.add_edges_from((user, friend) for user, profile in user_profiles.items()
+                                  for friend in profile['friends'])
     return social_network
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Social Network Friend Recommendation System")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--edges', help="edge list (optionally .gz) added to the profiles' friendships")
+    parser.add_argument('--classifier', default='knn', help="classifier type for MLModel.train_model")
+    parser.add_argument('--feature-set', default='profile', choices=['profile', 'structural'],
+                        help="'structural' adds Adamic-Adar, resource allocation, Jaccard, degree and community features")
+    parser.add_argument('--artifact-dir', default=ARTIFACT_DIR,
+                        help="where trained model artifacts are cached")
+    parser.add_argument('--no-artifacts', action='store_true', help="always retrain, never read or write artifacts")
+    parser.add_argument('--materialize-top-k', type=int, default=0,
+                        help="keep every user's top-K recommendations precomputed in the background (0 = off)")
+    parser.add_argument('--exit-after-first-window', action='store_true',
+                        help="print the time to first window and exit (used by benchmark_module)")
+    args = parser.parse_args(argv)
+    try:
+        profile_format(args.profiles)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
 if __name__ == "__main__":
-    # Load user profiles from CSV
-    user_profiles = load_user_profiles('/Users/karem/Documents/GitHub/Friends_Recommendation_System/user_profiles.csv')
-    # Create the social network graph
-    social_network = create_social_network(user_profiles)
-    # Initialize the machine learning model
-    ml_model = MLModel(user_profiles)
-    ml_model.train_model(classifier_type='knn')  # Choose the classifier type
+    args = parse_args()
+    import tkinter as tk
+    from gui_module import FriendRecommendationApp
+    from ingest_module import csv_path_for, load_network, source_format
+    from ml_module import MLModel
+    from search_module import FriendRecommendation
+
+    profiles_path = args.profiles
+    if args.edges or source_format(args.profiles) != 'csv' or args.profiles.endswith('.gz'):
+        # JSONL / gzipped profiles and extra edge lists are streamed in; edits are saved as a plain CSV
+        user_profiles, social_network, report = load_network(args.profiles, args.edges)
+        print(report)
+        profiles_path = csv_path_for(args.profiles)
+    else:
+        # Load user profiles from CSV
+        user_profiles = load_user_profiles(args.profiles)
+        # Create the social network graph
+        social_network = create_social_network(user_profiles)
+    # Initialize the machine learning model (trained in the background once the window is up)
+    ml_model = MLModel(user_profiles, args.feature_set)
     # Initialize the friend recommendation system
     friend_recommendation = FriendRecommendation(social_network, user_profiles, ml_model)
+    if args.materialize_top_k:
+        # Filled once the model is trained, then kept current as connections and users are edited
+        friend_recommendation.start_recommendation_view(args.materialize_top_k)
     # Initialize and run the GUI application
     root = tk.Tk()
-    app = FriendRecommendationApp(root, ml_model, friend_recommendation)
+    app = FriendRecommendationApp(root, ml_model, friend_recommendation, profiles_path=profiles_path)
+    if args.exit_after_first_window:
+        def report_first_window(event):
+            if event.widget is root:
+                print(f"first_window_seconds={time.perf_counter() - _process_start:.4f}", flush=True)
+                root.after(0, root.destroy)
+        root.bind('<Map>', report_first_window)
+    else:
+        app.start_background_training(args.classifier,
+                                      artifact_dir=None if args.no_artifacts else args.artifact_dir)
     root.mainloop()
@@ -0,0 +1,195 @@
+import argparse
+import random
+import threading
+import time
+
+from explanation_module import explain_pair, explanation_inputs
+from instrumentation_module import timed, count
+
+
+class RecommendationView:
+    """Materialized top-K recommendations for every user, kept up to date from graph_store's change feed
+
+    Each published graph version marks the users within two hops of the touched nodes dirty; a background
+    thread recomputes dirty users, oldest first, in batches through find_recommendations_batch. get() is
+    a dict lookup. An entry can only be served stale for max_staleness seconds: past that it is
+    recomputed on the read.
+    """
+
+    def __init__(self, friend_recommendation, top_k=10, max_staleness=2.0, batch_size=256):
+        self.friend_recommendation = friend_recommendation
+        self.ml_model = friend_recommendation.ml_model
+        self.top_k = top_k
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+        # user -> (graph version, recommendations, {candidate: explanation_inputs}), all from one snapshot
+        self.table = {}
+        self.dirty = {}  # user -> monotonic time it was first invalidated; insertion order is the queue
+        self.in_flight = {}  # Dirty users being recomputed, with the same timestamps
+        self.condition = threading.Condition()
+        self.last_error = None
+        self._model = None  # Model the table was computed with; a retrain invalidates everything
+        self._thread = None
+        self._stopped = False
+        friend_recommendation.graph_store.subscribe(self.on_graph_change)
+
+    def start(self):
+        if self._thread is None:
+            self.invalidate(self.friend_recommendation.snapshot().profiles)
+            self._thread = threading.Thread(target=self._run, name='recommendation_view', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self._stopped = True
+            self.condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def invalidate(self, users):
+        now = time.monotonic()
+        with self.condition:
+            for user in users:
+                # setdefault keeps the first invalidation time, which is what staleness is measured from
+                self.dirty.setdefault(user, now)
+            self.condition.notify()
+
+    def on_graph_change(self, snapshot, touched):
+        # graph_store listener. An edge edit touches both endpoints and a profile edit the user itself;
+        # in either case only users within two hops of them can gain, lose or re-score a candidate.
+        affected = set(touched)
+        for node in touched:
+            if node not in snapshot:
+                continue
+            for friend in snapshot.neighbors(node):
+                affected.add(friend)
+                affected.update(snapshot.neighbors(friend))
+        count('materialized.invalidated', len(affected))
+        self.invalidate(affected)
+
+    def get(self, user, explanations=None):
+        """user's top-K [(candidate, (probability, similarities))], at most max_staleness seconds old
+
+        Pass a dict as explanations to also get {candidate: Explanation}; they are built from inputs
+        saved with the entry, so mutual friends and shared interests match the scores shown. A user
+        without a profile, or who is not in the graph, gets [].
+        """
+        entry = self.table.get(user)
+        dirty_since = self.dirty.get(user) or self.in_flight.get(user)
+        if entry is None or (dirty_since is not None and time.monotonic() - dirty_since > self.max_staleness):
+            count('materialized.read_repair')
+            self.refresh([user])
+            entry = self.table.get(user)
+            if entry is None:  # Skipped by refresh()
+                return []
+        _, recommendations, inputs = entry
+        if explanations is not None:
+            for candidate, (probability, similarities) in recommendations:
+                explanations[candidate] = explain_pair(self.ml_model, user, candidate, probability, similarities,
+                                                       inputs=inputs[candidate])
+        return recommendations
+
+    @timed('materialized.refresh')
+    def refresh(self, users):
+        snapshot = self.friend_recommendation.snapshot()
+        # Users without a profile, or with one but no friendships (not graph nodes), have no recommendations;
+        # they are taken off the queue without an entry
+        skipped = [user for user in users if user not in snapshot.profiles or user not in snapshot]
+        users = [user for user in users if user in snapshot.profiles and user in snapshot]
+        with self.condition:
+            for user in skipped:
+                self.dirty.pop(user, None)
+            for user in users:
+                dirty_since = self.dirty.pop(user, None)
+                if dirty_since is not None:
+                    self.in_flight[user] = dirty_since
+        # A user invalidated after this point is queued again, so no change is lost
+        try:
+            results = self.friend_recommendation.find_recommendations_batch(users, self.top_k, snapshot)
+            for user, recommendations in results.items():
+                inputs = {candidate: explanation_inputs(self.ml_model, user, candidate, snapshot.profiles)
+                          for candidate, _ in recommendations}
+                self.table[user] = (snapshot.version, recommendations, inputs)
+        except Exception:
+            self.invalidate(users)
+            raise
+        finally:
+            for user in users:
+                self.in_flight.pop(user, None)
+        count('materialized.recomputed', len(results))
+        return results
+
+    def wait_until_fresh(self, timeout=None):
+        # True once the background thread has drained the dirty queue
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.dirty or self.in_flight:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._stopped and (not self.dirty or not self.ml_model.is_trained):
+                    # Polls while the model is still training in the background
+                    self.condition.wait(timeout=0.2)
+                if self._stopped:
+                    return
+                if self.ml_model.model is not self._model:
+                    self._model = self.ml_model.model
+                    self.invalidate(list(self.table))
+                batch = []
+                for user in self.dirty:
+                    batch.append(user)
+                    if len(batch) >= self.batch_size:
+                        break
+            try:
+                self.refresh(batch)
+            except Exception as e:
+                self.last_error = e
+                time.sleep(0.2)
+
+
+def main(argv=None):
+    from benchmark_module import add_model_arguments, load_and_train, scores_match
+    from main import create_social_network
+    from search_module import FriendRecommendation
+
+    parser = argparse.ArgumentParser(description="Measure read latency and freshness of the materialized view")
+    add_model_arguments(parser)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--edits', type=int, default=50, help="random friendships added, one commit each")
+    args = parser.parse_args(argv)
+
+    user_profiles, ml_model, users = load_and_train(args)
+    friend_recommendation = FriendRecommendation(create_social_network(user_profiles), user_profiles, ml_model)
+
+    view = RecommendationView(friend_recommendation, args.top_k)
+    start = time.perf_counter()
+    view.start()
+    view.wait_until_fresh()
+    print(f"Initial build of {len(view.table)} users: {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.edits):
+        a, b = rng.sample(users, 2)
+        friend_recommendation.add_friends(a, [b])
+    view.wait_until_fresh()
+    print(f"{args.edits} edits applied and recomputed in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for user in users:
+        view.get(user)
+    print(f"Read: {(time.perf_counter() - start) / len(users) * 1e6:.2f} us per user")
+    expected = friend_recommendation.find_recommendations_batch(users, args.top_k)
+    matches = scores_match({user: view.get(user) for user in users}, expected)
+    print(f"Matches on-demand results: {matches}")
+    view.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from instrumentation_module import timed, stage
+from ml_module import INCREMENTAL_CLASSIFIER_TYPES, make_incremental_classifier
+
+def _snapshot_training_inputs(user_profiles):
+    # Frozen user order and friend lists, so the row count stays exact while the GUI edits profiles
+    users = list(user_profiles)
+    friends = {user: list(user_profiles[user]['friends']) for user in users}
+    return users, friends
+
+
+def training_row_count(users, friends):
+    # Same layout as MLModel.build_training_set: per friend, one positive row then one row per non-friend
+    user_set = set(users)
+    total = 0
+    for user in users:
+        friend_set = set(friends[user])
+        negatives = len(users) - (1 if user in user_set else 0) - len(friend_set & user_set - {user})
+        total += len(friends[user]) * (1 + negatives)
+    return total
+
+
+@timed('ml.out_of_core.write')
+def write_training_memmap(ml_model, directory, block_rows=65536):
+    """Writes build_training_set's (X, y) to X.npy / y.npy in `directory` without holding it in memory
+
+    Negative rows only depend on the user, so each user's non-friend features are computed once per
+    block of block_rows candidates and copied to every friend's slot. Returns (X_path, y_path, rows).
+    """
+    users, friends = _snapshot_training_inputs(ml_model.training_profiles())
+    rows = training_row_count(users, friends)
+    X_path = os.path.join(directory, 'X.npy')
+    y_path = os.path.join(directory, 'y.npy')
+    X = np.lib.format.open_memmap(X_path, mode='w+', dtype=np.float32, shape=(rows, len(ml_model.feature_names)))
+    y = np.lib.format.open_memmap(y_path, mode='w+', dtype=np.int8, shape=(rows,))
+
+    offset = 0
+    for user in users:
+        user_friends = friends[user]
+        if not user_friends:
+            continue
+        friend_set = set(user_friends)
+        negatives = [other for other in users if other != user and other not in friend_set]
+        stride = 1 + len(negatives)
+
+        positives = np.asarray(ml_model.calculate_similarity_batch([(user, friend) for friend in user_friends]),
+                               dtype=np.float32)
+        slots = offset + np.arange(len(user_friends)) * stride
+        X[slots] = positives
+        y[slots] = 1
+
+        for start in range(0, len(negatives), block_rows):
+            block = negatives[start:start + block_rows]
+            features = np.asarray(ml_model.calculate_similarity_batch([(user, other) for other in block]),
+                                  dtype=np.float32)
+            for slot in slots:
+                X[slot + 1 + start:slot + 1 + start + len(block)] = features
+                y[slot + 1 + start:slot + 1 + start + len(block)] = 0
+        offset += len(user_friends) * stride
+
+    X.flush()
+    y.flush()
+    del X, y
+    return X_path, y_path, rows
+
+
+def _test_mask(block_index, n, test_size, seed):
+    # Deterministic per-block split, so every pass over the memmap sees the same train/test rows
+    return np.random.default_rng((seed, block_index)).random(n) < test_size
+
+
+def _blocks(rows, block_rows):
+    return [(i, start, min(start + block_rows, rows)) for i, start in enumerate(range(0, rows, block_rows))]
+
+
+@timed('ml.out_of_core.train')
+def train_out_of_core(ml_model, classifier_type='logistic', params=None, directory=None, batch_rows=65536,
+                      block_rows=4096, epochs=3, test_size=0.3, seed=42, keep_files=False):
+    """Trains ml_model on the full training set streamed from a memory-mapped .npy file
+
+    Peak memory is bounded by batch_rows, not by the dataset: the scaler is fitted with partial_fit in
+    one pass, then every epoch feeds mini-batches of randomly chosen contiguous blocks to partial_fit.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    model = make_incremental_classifier(classifier_type, params)
+    owns_directory = directory is None
+    directory = directory or tempfile.mkdtemp(prefix='frs_training_')
+    os.makedirs(directory, exist_ok=True)
+    try:
+        X_path, y_path, rows = write_training_memmap(ml_model, directory, block_rows=batch_rows)
+        X = np.load(X_path, mmap_mode='r')
+        y = np.load(y_path, mmap_mode='r')
+        blocks = _blocks(rows, block_rows)
+
+        def train_rows(index, start, end):
+            # Regenerated on every pass instead of cached, so nothing grows with the row count
+            return ~_test_mask(index, end - start, test_size, seed)
+
+        with stage('ml.out_of_core.scale'):
+            scaler = StandardScaler()
+            for index, start, end in blocks:
+                keep = train_rows(index, start, end)
+                if keep.any():
+                    scaler.partial_fit(X[start:end][keep])
+
+        rng = np.random.default_rng(seed)
+        blocks_per_batch = max(1, batch_rows // block_rows)
+        with stage('ml.out_of_core.fit'):
+            for _ in range(epochs):
+                order = rng.permutation(len(blocks))
+                for first in range(0, len(order), blocks_per_batch):
+                    chosen = sorted(order[first:first + blocks_per_batch])  # Sorted for sequential reads
+                    X_parts, y_parts = [], []
+                    for index in chosen:
+                        _, start, end = blocks[index]
+                        keep = train_rows(index, start, end)
+                        X_parts.append(X[start:end][keep])
+                        y_parts.append(y[start:end][keep])
+                    X_batch = np.concatenate(X_parts)
+                    y_batch = np.concatenate(y_parts)
+                    if not len(y_batch):
+                        continue
+                    shuffle = rng.permutation(len(y_batch))
+                    model.partial_fit(scaler.transform(X_batch[shuffle]), y_batch[shuffle], classes=[0, 1])
+
+        # Accuracy is accumulated block by block, like everything else
+        correct = {'train': 0, 'test': 0}
+        seen = {'train': 0, 'test': 0}
+        for index, start, end in blocks:
+            keep = train_rows(index, start, end)
+            hits = model.predict(scaler.transform(X[start:end])) == y[start:end]
+            correct['train'] += int(hits[keep].sum())
+            correct['test'] += int(hits[~keep].sum())
+            seen['train'] += int(keep.sum())
+            seen['test'] += int((~keep).sum())
+        del X, y
+    finally:
+        if owns_directory and not keep_files:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    train_accuracy = correct['train'] / seen['train'] if seen['train'] else 0.0
+    test_accuracy = correct['test'] / seen['test'] if seen['test'] else 0.0
+    print("Training accuracy:", train_accuracy)
+    print("Test accuracy:", test_accuracy)
+    ml_model.metrics = {'train_accuracy': train_accuracy, 'test_accuracy': test_accuracy, 'rows': rows}
+    # Publish both together so readers never see a half-trained model
+    ml_model.scaler, ml_model.model = scaler, model
+    return ml_model.metrics
+
+
+def peak_rss_mb():
+    import resource  # Unix only
+    # ru_maxrss is in KiB on Linux; file-backed memmap pages count too, but they are reclaimable
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    from main import PROFILES_CSV, load_user_profiles
+    from ml_module import MLModel, FEATURE_SETS
+
+    parser = argparse.ArgumentParser(description="Train on the full pair set streamed from a memory-mapped file")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--classifier', choices=INCREMENTAL_CLASSIFIER_TYPES, default='logistic')
+    parser.add_argument('--feature-set', default='profile', choices=list(FEATURE_SETS))
+    parser.add_argument('--data-dir', help="where X.npy / y.npy are written (kept); a temp dir otherwise")
+    parser.add_argument('--batch-rows', type=int, default=65536, help="rows per partial_fit call")
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    ml_model = MLModel(load_user_profiles(args.profiles), args.feature_set)
+    start = time.perf_counter()
+    metrics = train_out_of_core(ml_model, args.classifier, directory=args.data_dir, batch_rows=args.batch_rows,
+                                epochs=args.epochs, keep_files=args.data_dir is not None)
+    print(f"Trained on {metrics['rows']} rows in {time.perf_counter() - start:.2f}s, "
+          f"peak RSS {peak_rss_mb():.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import numpy as np
+
+from instrumentation_module import timed
+
+
+def walk_segments(indptr, indices, starts, segment_length, rng, prefix=None, kept=None):
+    """One plain random walk of segment_length steps from each of starts over the CSR graph, as an int32 array
+
+    All walks advance one step at a time, vectorized over every walk. With prefix (an earlier walk per
+    start) and kept, each walk keeps its first kept[i] steps from prefix and is continued from there.
+    """
+    current = np.asarray(starts, dtype=np.int64)
+    segments = np.empty((len(current), segment_length), dtype=np.int32)
+    for step in range(segment_length):
+        degree = indptr[current + 1] - indptr[current]
+        offsets = (rng.random(len(current)) * degree).astype(np.int64)
+        moved = indices[np.minimum(indptr[current] + offsets, max(len(indices) - 1, 0))] \
+            if len(indices) else current
+        current = np.where(degree > 0, moved, current)  # Isolated nodes stay put
+        if prefix is not None:
+            current = np.where(step < kept, prefix[:, step], current)
+        segments[:, step] = current
+    return segments
+
+
+class RandomWalkIndex:
+    """Precomputed random-walk segments for Monte-Carlo personalized PageRank queries
+
+    Every node stores `walks_per_node` plain random walks of `segment_length` steps. A query
+    simulates walks with restart from the source by stitching stored segments together, each one
+    used at most once so the walks stay independent; once a node's segments are used up the walk
+    continues with fresh random steps. Its cost is bounded by num_walks / alpha steps no matter
+    how large the graph is. After edits, updated() gives a new index that re-walks only the
+    segments going through an edited node.
+    """
+
+    def __init__(self, social_network, walks_per_node=4, segment_length=8, seed=42):
+        self.walks_per_node = walks_per_node
+        self.segment_length = segment_length
+        self.seed = seed
+        self.updates = 0  # updated() calls this index descends from, so each draws different walks
+        self.build(social_network)
+
+    @timed('ppr.build_index')
+    def build(self, social_network):
+        self.nodes = list(social_network.nodes())
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self._transition = None  # Sparse transition matrix, built on the first power-iteration query
+
+        # CSR adjacency
+        degrees = np.fromiter((social_network.degree(node) for node in self.nodes),
+                              dtype=np.int64, count=len(self.nodes))
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=self.indptr[1:])
+        self.indices = np.fromiter(
+            (self.node_ids[neighbor] for node in self.nodes for neighbor in social_network.neighbors(node)),
+            dtype=np.int32, count=int(self.indptr[-1]))
+
+        n = len(self.nodes)
+        starts = np.repeat(np.arange(n, dtype=np.int64), self.walks_per_node)
+        segments = walk_segments(self.indptr, self.indices, starts, self.segment_length,
+                                 np.random.default_rng(self.seed))
+        self.segments = segments.reshape(n, self.walks_per_node, self.segment_length)
+
+    @timed('ppr.update_index')
+    def updated(self, social_network, touched):
+        """A new index for social_network, whose edges differ from this index's graph only at touched nodes
+
+        Only the touched nodes' neighbors are read from the graph; every other CSR row is moved over in
+        bulk. A segment that starts at a touched node or steps from one keeps its steps up to the first
+        such node and is re-walked from there, since the next step was drawn from the old neighbor list;
+        by the Markov property the result is distributed as a fresh walk on the new graph. All other
+        segments are kept. Nodes new to the graph must be in touched. This index is left unchanged for
+        queries still using it.
+        """
+        index = object.__new__(RandomWalkIndex)
+        index.walks_per_node = self.walks_per_node
+        index.segment_length = self.segment_length
+        index.seed = self.seed
+        index.updates = self.updates + 1
+        index._transition = None
+
+        new_nodes = [node for node in touched if node not in self.node_ids and node in social_network]
+        index.nodes = self.nodes + new_nodes if new_nodes else self.nodes
+        index.node_ids = self.node_ids
+        if new_nodes:
+            index.node_ids = dict(self.node_ids)
+            for node in new_nodes:
+                index.node_ids[node] = len(index.node_ids)
+        old_n, n = len(self.nodes), len(index.nodes)
+        rows = {index.node_ids[node]: [index.node_ids[neighbor] for neighbor in social_network.neighbors(node)]
+                for node in touched if node in index.node_ids}
+        changed = np.zeros(n, dtype=bool)
+        changed[list(rows)] = True
+
+        # CSR: untouched rows keep their neighbors and only shift to their new offsets
+        old_degrees = np.diff(self.indptr)
+        degrees = np.zeros(n, dtype=np.int64)
+        degrees[:old_n] = old_degrees
+        for i, row in rows.items():
+            degrees[i] = len(row)
+        index.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degrees, out=index.indptr[1:])
+        index.indices = np.empty(int(index.indptr[-1]), dtype=np.int32)
+        unchanged = np.repeat(~changed[:old_n], old_degrees)
+        shift = np.repeat(index.indptr[:old_n] - self.indptr[:-1], old_degrees)
+        index.indices[np.flatnonzero(unchanged) + shift[unchanged]] = self.indices[unchanged]
+        for i, row in rows.items():
+            index.indices[index.indptr[i]:index.indptr[i + 1]] = row
+
+        segments = np.zeros((n * self.walks_per_node, self.segment_length), dtype=np.int32)
+        segments[:old_n * self.walks_per_node] = self.segments.reshape(-1, self.segment_length)
+        starts = np.repeat(np.arange(n, dtype=np.int64), self.walks_per_node)
+        # Column 0 is the start node, so a hit at column j means steps j onward were drawn from old neighbors
+        hits = changed[np.column_stack([starts, segments[:, :-1]])]
+        stale = np.flatnonzero(hits.any(axis=1))
+        segments[stale] = walk_segments(index.indptr, index.indices, starts[stale], self.segment_length,
+                                        np.random.default_rng([self.seed, index.updates]),
+                                        segments[stale], hits[stale].argmax(axis=1))
+        index.segments = segments.reshape(n, self.walks_per_node, self.segment_length)
+        return index
+
+    @timed('ppr.query')
+    def personalized_pagerank(self, source, num_walks=200, alpha=0.15, seed=None):
+        """Approximate PPR scores from `source` as {node: score}, using visit counts of walks with restart"""
+        source_id = self.node_ids[source]
+        rng = np.random.default_rng(seed)
+        # Each walk continues with probability 1 - alpha per step, so its length is geometric
+        lengths = rng.geometric(alpha, size=num_walks) - 1
+        # Enough uniforms for every step to be a fresh one; most steps come from stored segments instead
+        uniforms = rng.random(int(lengths.sum())).tolist()
+        draw = 0
+        used = {}  # Stored segments already taken per node, so no segment is reused within the query
+        visits = {}  # A dict, not an N-sized array, keeps the query cost independent of graph size
+        for length in lengths.tolist():
+            current = source_id
+            while length > 0:
+                k = used.get(current, 0)
+                if k < self.walks_per_node:
+                    # Take this node's next unused segment, then continue from the segment's last node
+                    used[current] = k + 1
+                    segment = self.segments[current, k]
+                    for node in segment[:length].tolist():
+                        visits[node] = visits.get(node, 0) + 1
+                    length -= self.segment_length
+                    current = int(segment[-1])
+                else:
+                    # Segments used up: one fresh step to a uniformly chosen neighbor
+                    start, end = int(self.indptr[current]), int(self.indptr[current + 1])
+                    if end > start:
+                        current = int(self.indices[start + int(uniforms[draw] * (end - start))])
+                    draw += 1
+                    visits[current] = visits.get(current, 0) + 1
+                    length -= 1
+        total = sum(visits.values())
+        if total == 0:
+            return {}
+        return {self.nodes[i]: count / total for i, count in visits.items()}
+
+    @timed('ppr.power_iteration')
+    def personalized_pagerank_power(self, source, alpha=0.15, tol=1e-6, max_iter=50):
+        """Exact-ish PPR by sparse power iteration; cost is O(max_iter * E) per query"""
+        from scipy.sparse import csr_matrix
+
+        if self._transition is None:
+            n = len(self.nodes)
+            degree = np.diff(self.indptr)
+            rows = np.repeat(np.arange(n), degree)
+            weights = 1.0 / degree[rows]
+            # Column j holds the out-probabilities of node j, so P @ x spreads mass along edges
+            self._transition = csr_matrix((weights, (self.indices, rows)), shape=(n, n))
+        restart = np.zeros(len(self.nodes))
+        restart[self.node_ids[source]] = 1.0
+        scores = restart.copy()
+        for _ in range(max_iter):
+            updated = alpha * restart + (1 - alpha) * (self._transition @ scores)
+            converged = np.abs(updated - scores).sum() < tol
+            scores = updated
+            if converged:
+                break
+        scores[self.node_ids[source]] = 0.0
+        nonzero = np.flatnonzero(scores > 0)
+        return {self.nodes[i]: float(scores[i]) for i in nonzero}
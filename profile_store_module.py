@@ -0,0 +1,295 @@
+import argparse
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from graph_store_module import FriendSet
+from instrumentation_module import timed, count
+from search_module import candidate_pairs, score_pairs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    age INTEGER NOT NULL,
+    location TEXT NOT NULL,
+    occupation TEXT NOT NULL,
+    activities TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (user_id INTEGER NOT NULL, friend TEXT NOT NULL, position INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS edges_by_user ON edges (user_id, position);
+CREATE INDEX IF NOT EXISTS edges_by_friend ON edges (friend);
+CREATE TABLE IF NOT EXISTS interests (user_id INTEGER NOT NULL, interest TEXT NOT NULL, position INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS interests_by_user ON interests (user_id, position);
+"""
+
+# Every bulk query takes its ID list as one JSON array parameter, so the SQL text never changes with the list
+# length and each connection's statement cache keeps one prepared statement per query
+FETCH_USERS = ("SELECT id, name, age, location, occupation, activities FROM users "
+               "WHERE name IN (SELECT value FROM json_each(?))")
+FETCH_FRIENDS = ("SELECT user_id, friend FROM edges WHERE user_id IN (SELECT value FROM json_each(?)) "
+                 "ORDER BY user_id, position")
+FETCH_INTERESTS = ("SELECT user_id, interest FROM interests WHERE user_id IN (SELECT value FROM json_each(?)) "
+                   "ORDER BY user_id, position")
+FETCH_LISTED_BY = ("SELECT edges.friend, users.name FROM edges JOIN users ON users.id = edges.user_id "
+                   "WHERE edges.friend IN (SELECT value FROM json_each(?)) ORDER BY edges.rowid")
+
+
+class ConnectionPool:
+    """A fixed set of SQLite connections handed out one thread at a time"""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self._idle = queue.Queue()
+        for _ in range(size):
+            connection = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+            connection.execute("PRAGMA journal_mode=WAL")  # Readers do not block each other or the writer
+            self._idle.put(connection)
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+class SQLiteProfileStore:
+    """user_profiles kept in SQLite: indexed users, edges and interests tables, read in bulk by name list"""
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    @timed('store.import_profiles')
+    def import_profiles(self, user_profiles, batch_size=10000):
+        """Adds (or replaces) every profile in user_profiles; friend and interest order is kept"""
+        with self.pool.connection() as connection, connection:
+            items = list(user_profiles.items())
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                names = json.dumps([name for name, _ in batch])
+                connection.execute("DELETE FROM edges WHERE user_id IN "
+                                   "(SELECT id FROM users WHERE name IN (SELECT value FROM json_each(?)))", (names,))
+                connection.execute("DELETE FROM interests WHERE user_id IN "
+                                   "(SELECT id FROM users WHERE name IN (SELECT value FROM json_each(?)))", (names,))
+                connection.executemany(
+                    "INSERT INTO users (name, age, location, occupation, activities) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET age = excluded.age, location = excluded.location, "
+                    "occupation = excluded.occupation, activities = excluded.activities",
+                    [(name, p['age'], p['location'], p['occupation'], p['activities']) for name, p in batch])
+                ids = dict(connection.execute("SELECT name, id FROM users WHERE name IN "
+                                              "(SELECT value FROM json_each(?))", (names,)))
+                connection.executemany("INSERT INTO edges VALUES (?, ?, ?)",
+                                       [(ids[name], friend, i) for name, p in batch
+                                        for i, friend in enumerate(p['friends'])])
+                connection.executemany("INSERT INTO interests VALUES (?, ?, ?)",
+                                       [(ids[name], interest, i) for name, p in batch
+                                        for i, interest in enumerate(p['interests'])])
+
+    @timed('store.fetch_many')
+    def fetch_many(self, names):
+        """{name: profile} for the names that exist, in three queries regardless of how many there are"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        with self.pool.connection() as connection:
+            users = connection.execute(FETCH_USERS, (json.dumps(names),)).fetchall()
+            ids = json.dumps([row[0] for row in users])
+            friends = {}
+            for user_id, friend in connection.execute(FETCH_FRIENDS, (ids,)):
+                friends.setdefault(user_id, []).append(friend)
+            interests = {}
+            for user_id, interest in connection.execute(FETCH_INTERESTS, (ids,)):
+                interests.setdefault(user_id, []).append(interest)
+        count('store.rows_fetched', len(users))
+        return {name: {
+            'interests': interests.get(user_id, []),
+            'friends': FriendSet(friends.get(user_id, ())),
+            'age': age,
+            'location': location,
+            'occupation': occupation,
+            'activities': activities,
+        } for user_id, name, age, location, occupation, activities in users}
+
+    def listed_by(self, names):
+        # {name: [users whose friend list contains name]}, the reverse direction of the edges table
+        result = {}
+        with self.pool.connection() as connection:
+            for friend, name in connection.execute(FETCH_LISTED_BY, (json.dumps(list(names)),)):
+                result.setdefault(friend, []).append(name)
+        return result
+
+    def exists(self, name):
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self):
+        with self.pool.connection() as connection:
+            return [name for name, in connection.execute("SELECT name FROM users ORDER BY id")]
+
+    def __len__(self):
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        self.pool.close()
+
+
+class CachedProfileStore(Mapping):
+    """Read-only user_profiles mapping over a SQLiteProfileStore with a hot in-memory LRU tier
+
+    Callers that know what they will read next call prefetch() so that the misses are fetched in one
+    bulk query, and keep the dict it returns; a plain lookup that misses costs one query of its own.
+    """
+
+    def __init__(self, store, capacity=100000):
+        self.store = store
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _put_many(self, profiles):
+        with self._lock:
+            for name, profile in profiles.items():
+                self._cache[name] = profile
+                self._cache.move_to_end(name)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def prefetch(self, names):
+        """{name: profile} for those of names that exist, fetching all the uncached ones in one bulk query"""
+        found = {}
+        missing = []
+        with self._lock:
+            for name in dict.fromkeys(names):
+                profile = self._cache.get(name)
+                if profile is None:
+                    missing.append(name)
+                else:
+                    found[name] = profile
+        if missing:
+            fetched = self.store.fetch_many(missing)
+            self._put_many(fetched)
+            found.update(fetched)
+        return found
+
+    def __getitem__(self, name):
+        with self._lock:
+            profile = self._cache.get(name)
+            if profile is not None:
+                self._cache.move_to_end(name)
+                self.hits += 1
+                return profile
+            self.misses += 1
+        profiles = self.store.fetch_many([name])
+        if name not in profiles:
+            raise KeyError(name)
+        self._put_many(profiles)
+        return profiles[name]
+
+    def __contains__(self, name):
+        return name in self._cache or self.store.exists(name)
+
+    def __iter__(self):
+        return iter(self.store.names())
+
+    def __len__(self):
+        return len(self.store)
+
+
+class StoreRecommendation:
+    """find_recommendations over a CachedProfileStore, fetching each BFS level in bulk
+
+    A batch of users costs a fixed number of round trips: the users, their friends, then the
+    candidates, each as one prefetch. The profiles those return are merged into one dict that
+    scoring reads, so no pair goes back to the store even when the batch does not fit in the
+    cache; candidates and ranking are search_module's, the same as FriendRecommendation's.
+    """
+
+    def __init__(self, profiles, ml_model):
+        self.profiles = profiles
+        self.ml_model = ml_model
+
+    def neighbors_many(self, names, found):
+        # Symmetric neighbors like the networkx graph: each user's own friend list plus everyone listing them.
+        # The fetched profiles are added to found
+        found.update(self.profiles.prefetch(names))
+        reverse = self.profiles.store.listed_by(names)
+        result = {}
+        for name in names:
+            own = found[name]['friends'] if name in found else ()
+            result[name] = list(dict.fromkeys([*own, *reverse.get(name, ())]))
+        return result
+
+    @timed('store.find_recommendations_batch')
+    def find_recommendations_batch(self, users, top_k=None):
+        users = list(dict.fromkeys(users))
+        profiles = {}
+        adjacency = self.neighbors_many(users, profiles)
+        friends = {friend for user in users for friend in adjacency[user]}
+        adjacency.update(self.neighbors_many([friend for friend in friends if friend not in adjacency], profiles))
+
+        pairs, spans = candidate_pairs(users, adjacency.__getitem__)
+        profiles.update(self.profiles.prefetch([candidate for _, candidate in pairs if candidate not in profiles]))
+        return score_pairs(self.ml_model, pairs, spans, profiles, top_k)
+
+    def find_recommendations(self, user, top_k=None):
+        return self.find_recommendations_batch([user], top_k)[user]
+
+
+def main(argv=None):
+    from benchmark_module import add_model_arguments, load_and_train, scores_match
+    from main import create_social_network
+    from ml_module import MLModel
+    from search_module import FriendRecommendation
+
+    parser = argparse.ArgumentParser(description="Import profiles into SQLite and query recommendations from it")
+    add_model_arguments(parser)
+    parser.add_argument('--db', default='profiles.db')
+    parser.add_argument('--cache', type=int, default=100000, help="profiles kept in the in-memory LRU tier")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=100, help="users per batched query")
+    args = parser.parse_args(argv)
+
+    user_profiles, trained, queries = load_and_train(args, args.queries)
+    store = SQLiteProfileStore(args.db)
+    start = time.perf_counter()
+    store.import_profiles(user_profiles)
+    print(f"Imported {len(store)} users into {args.db} in {time.perf_counter() - start:.2f}s")
+
+    profiles = CachedProfileStore(store, args.cache)
+    ml_model = MLModel(profiles)
+    ml_model.scaler, ml_model.model = trained.scaler, trained.model
+    recommender = StoreRecommendation(profiles, ml_model)
+
+    start = time.perf_counter()
+    results = {}
+    for i in range(0, len(queries), args.batch):
+        results.update(recommender.find_recommendations_batch(queries[i:i + args.batch], 10))
+    elapsed = time.perf_counter() - start
+    expected = FriendRecommendation(create_social_network(user_profiles), user_profiles, trained) \
+        .find_recommendations_batch(queries, 10)
+    matches = scores_match(results, expected, queries)
+    print(f"{len(queries) / elapsed:.1f} users/s from SQLite, cache hits {profiles.hits}, misses {profiles.misses}, "
+          f"matches={matches}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
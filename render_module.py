@@ -0,0 +1,200 @@
+import argparse
+import multiprocessing
+import os
+
+import networkx as nx
+
+from instrumentation_module import timed, stage
+
+LAYOUTS = ('spring', 'circular', 'random', 'shell')
+# Above this many nodes in a drawing, labels are left out; they cost more than the rest of the draw
+MAX_LABELED_NODES = 2000
+
+
+def compute_layout(graph, layout='spring', seed=None):
+    with stage('render.layout'):
+        if layout == 'spring':
+            return nx.spring_layout(graph, k=1.5, iterations=50, seed=seed)
+        elif layout == 'circular':
+            return nx.circular_layout(graph)
+        elif layout == 'random':
+            return nx.random_layout(graph, seed=seed)
+        elif layout == 'shell':
+            return nx.shell_layout(graph)
+    raise ValueError(f"Unknown layout: {layout}")
+
+
+def node_colors(graph, highlighted=None, scores=None, node_color='#ADD8E6'):
+    # Highlighted user in red, recommended candidates shaded green by score, everyone else node_color
+    from matplotlib import colormaps
+    from matplotlib.colors import to_hex
+
+    scores = scores or {}
+    greens = colormaps['Greens']
+    return ['#FF0000' if node == highlighted
+            else to_hex(greens(0.3 + 0.7 * scores[node] / 100)) if node in scores
+            else node_color
+            for node in graph.nodes()]
+
+
+def new_figure(zoom=0.6, width=8, height=6, dpi=100):
+    """A Figure attached to an Agg canvas, outside pyplot's figure registry
+
+    Nothing keeps a reference to it but the caller, so it is freed as soon as it is dropped;
+    pyplot figures stay alive until plt.close is called on them.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(width * zoom, height * zoom), dpi=dpi)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def draw_network(figure, graph, pos, colors=None, title=None, zoom=0.6, node_size=1500, edge_color='#666666',
+                 labels=None):
+    """Draws graph at pos on a new axes of figure, like the main window does"""
+    ax = figure.add_subplot()
+    if labels is None:
+        labels = graph.number_of_nodes() <= MAX_LABELED_NODES
+    with stage('render.draw'):
+        nx.draw(
+            graph,
+            pos,
+            with_labels=labels,
+            node_color=colors if colors is not None else '#ADD8E6',
+            node_size=node_size * zoom,
+            font_size=8 * zoom,
+            font_weight='bold',
+            edge_color=edge_color,
+            width=1.5,
+            ax=ax
+        )
+        if title:
+            ax.set_title(title, pad=20, fontsize=14)
+    return ax
+
+
+@timed('render.render_to_file')
+def render_to_file(graph, filename, pos=None, layout='spring', colors=None, title=None, zoom=0.6,
+                   node_size=1500, dpi=300, seed=None):
+    """Renders graph headlessly to filename; the format (png, svg, pdf, ...) follows the extension"""
+    if pos is None:
+        pos = compute_layout(graph, layout, seed)
+    figure = new_figure(zoom)
+    draw_network(figure, graph, pos, colors, title, zoom, node_size)
+    figure.tight_layout()
+    figure.savefig(filename, dpi=dpi, bbox_inches='tight')
+    return filename
+
+
+def _tile_bounds(pos, rows, cols):
+    xs = [x for x, _ in pos.values()]
+    ys = [y for _, y in pos.values()]
+    x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+    pad_x = (x1 - x0) * 0.02 or 0.1
+    pad_y = (y1 - y0) * 0.02 or 0.1
+    x0, x1, y0, y1 = x0 - pad_x, x1 + pad_x, y0 - pad_y, y1 + pad_y
+    width = (x1 - x0) / cols
+    height = (y1 - y0) / rows
+    # Row 0 is the top of the picture
+    return [(row, col, (x0 + col * width, x0 + (col + 1) * width, y1 - (row + 1) * height, y1 - row * height))
+            for row in range(rows) for col in range(cols)]
+
+
+def _tile_subgraph(pos, edges, bounds):
+    # Nodes inside the tile plus every edge whose bounding box overlaps it, so lines crossing the tile are drawn
+    left, right, bottom, top = bounds
+    nodes = {node for node, (x, y) in pos.items() if left <= x <= right and bottom <= y <= top}
+    tile_edges = []
+    for a, b in edges:
+        (ax, ay), (bx, by) = pos[a], pos[b]
+        if (a in nodes or b in nodes
+                or (min(ax, bx) <= right and max(ax, bx) >= left and min(ay, by) <= top and max(ay, by) >= bottom)):
+            tile_edges.append((a, b))
+    tile = nx.Graph()
+    tile.add_nodes_from(nodes)
+    tile.add_edges_from(tile_edges)
+    return tile
+
+
+def _render_tile(args):
+    tile, pos, colors, bounds, filename, tile_px, node_size, labels = args
+    figure = new_figure(width=tile_px / 100, height=tile_px / 100, zoom=1, dpi=100)
+    ax = draw_network(figure, tile, pos, [colors.get(node, '#ADD8E6') for node in tile.nodes()], zoom=1,
+                      node_size=node_size, labels=labels)
+    left, right, bottom, top = bounds
+    ax.set_xlim(left, right)
+    ax.set_ylim(bottom, top)
+    ax.set_position([0, 0, 1, 1])  # No margins, so neighboring tiles line up edge to edge
+    ax.set_axis_off()
+    figure.savefig(filename, dpi=100)
+    return filename
+
+
+@timed('render.render_tiles')
+def render_tiles(graph, directory, rows=2, cols=2, pos=None, layout='spring', colors=None, tile_px=2048,
+                 node_size=300, processes=None, seed=None):
+    """Renders graph as a rows x cols grid of tile_{row}_{col}.png images, the tiles in parallel
+
+    The layout is computed once; each worker only gets the nodes and edges that touch its tile.
+    Returns the file names in row-major order.
+    """
+    if pos is None:
+        pos = compute_layout(graph, layout, seed)
+    os.makedirs(directory, exist_ok=True)
+    colors = dict(zip(graph.nodes(), colors)) if colors is not None else {}
+    edges = list(graph.edges())
+    jobs = []
+    for row, col, bounds in _tile_bounds(pos, rows, cols):
+        tile = _tile_subgraph(pos, edges, bounds)
+        tile_pos = {node: pos[node] for node in tile.nodes()}
+        labels = tile.number_of_nodes() <= MAX_LABELED_NODES
+        jobs.append((tile, tile_pos, {node: colors[node] for node in tile.nodes() if node in colors}, bounds,
+                     os.path.join(directory, f"tile_{row}_{col}.png"), tile_px, node_size, labels))
+    if processes == 1:
+        return [_render_tile(job) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_render_tile, jobs)
+
+
+def main(argv=None):
+    from main import PROFILES_CSV, create_social_network, load_user_profiles
+
+    parser = argparse.ArgumentParser(description="Render the social network without a display")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--output', default='social_network.png', help="image file (.png, .svg, ...) or tile directory")
+    parser.add_argument('--layout', choices=LAYOUTS, default='spring')
+    parser.add_argument('--ego', metavar='USER', help="draw only USER's neighborhood")
+    parser.add_argument('--hops', type=int, default=1)
+    parser.add_argument('--tiles', type=int, nargs=2, metavar=('ROWS', 'COLS'),
+                        help="render a grid of tiles into the --output directory instead of one image")
+    parser.add_argument('--processes', type=int, help="parallel tile renderers (default: one per CPU)")
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42, help="layout seed")
+    args = parser.parse_args(argv)
+
+    user_profiles = load_user_profiles(args.profiles)
+    graph = create_social_network(user_profiles)
+    colors = None
+    title = "Social Network Graph"
+    if args.ego:
+        from ml_module import MLModel
+        from search_module import FriendRecommendation
+        # The model is never trained: ego_network only reads the graph
+        friend_recommendation = FriendRecommendation(graph, user_profiles, MLModel(user_profiles))
+        graph = friend_recommendation.ego_network(args.ego, args.hops)
+        colors = node_colors(graph, highlighted=args.ego)
+        title = f"Ego Network of {args.ego}"
+
+    pos = compute_layout(graph, args.layout, args.seed)
+    if args.tiles:
+        files = render_tiles(graph, args.output, *args.tiles, pos=pos, colors=colors, processes=args.processes)
+        print(f"Wrote {len(files)} tiles to {args.output}")
+    else:
+        render_to_file(graph, args.output, pos=pos, colors=colors, title=title, dpi=args.dpi)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
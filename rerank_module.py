@@ -0,0 +1,116 @@
+import numpy as np
+
+from encoding_module import popcount
+from instrumentation_module import timed
+
+DIVERSITY_METHODS = ('mmr', 'quota')
+GROUP_BY = ('location', 'occupation', 'bridge', 'community')
+
+
+def _bridges(user, names, profiles):
+    # (C, degree) bool matrix: which of user's friends each candidate is connected to
+    friend_index = {friend: i for i, friend in enumerate(profiles[user]['friends'])}
+    bridges = np.zeros((len(names), max(1, len(friend_index))), dtype=bool)
+    for row, name in enumerate(names):
+        for friend in profiles[name]['friends']:
+            column = friend_index.get(friend)
+            if column is not None:
+                bridges[row, column] = True
+    return bridges
+
+
+def _jaccard_to(matrix, i, count):
+    inter = count(matrix & matrix[i])
+    union = count(matrix | matrix[i])
+    return np.divide(inter, union, out=np.zeros(len(matrix)), where=union > 0)
+
+
+def rerank_mmr(user, pool, profiles, ml_model, top_k, trade_off=0.7):
+    """Maximal marginal relevance: each pick maximizes trade_off * score - (1 - trade_off) * max similarity
+    to the candidates already picked
+
+    Candidate-to-candidate similarity is the mean of interest Jaccard, same location, same occupation
+    and the Jaccard of the user's friends each one is reached through (its friend cluster). Only the
+    similarities to the last pick are computed per step, so the cost is O(top_k * len(pool)).
+    """
+    names = [name for name, _ in pool]
+    relevance = np.array([score[0] for _, score in pool]) / 100
+    encoder = ml_model.encoder
+    encoder.ensure_many(names)
+    interests = encoder.interests.bits[[encoder.interests.rows[name] for name in names]]
+    columns = encoder.columns[encoder.column_rows(names)]
+    bridges = _bridges(user, names, profiles)
+
+    def count_bits(words):
+        return popcount(words).sum(axis=1, dtype=np.int64)
+
+    def count_true(flags):
+        return flags.sum(axis=1)
+
+    max_similarity = np.zeros(len(names))
+    chosen = np.zeros(len(names), dtype=bool)
+    picks = []
+    for _ in range(min(top_k, len(names))):
+        gain = trade_off * relevance - (1 - trade_off) * max_similarity
+        gain[chosen] = -np.inf
+        i = int(np.argmax(gain))  # First of equal gains, so ties keep the score order
+        chosen[i] = True
+        picks.append(i)
+        similarity = (_jaccard_to(interests, i, count_bits) + _jaccard_to(bridges, i, count_true)
+                      + (columns[:, 1] == columns[i, 1]) + (columns[:, 2] == columns[i, 2])) / 4
+        np.maximum(max_similarity, similarity, out=max_similarity)
+    return [pool[i] for i in picks]
+
+
+def rerank_quota(user, pool, profiles, ml_model, top_k, group_by='location', max_per_group=2):
+    """At most max_per_group picks per group in score order; leftover slots are filled from the skipped
+
+    Groups are the candidate's location or occupation, its bridge (the first of user's friends it
+    is reached through) or its label-propagation community. One pass over the pool.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f"Unknown group_by: {group_by}")
+    if group_by == 'bridge':
+        friends = set(profiles[user]['friends'])
+
+        def group_of(name):
+            return next((friend for friend in profiles[name]['friends'] if friend in friends), None)
+    elif group_by == 'community':
+        community = ml_model.structure.community
+
+        def group_of(name):
+            return community.get(name, name)
+    else:
+        def group_of(name):
+            return profiles[name][group_by]
+
+    taken = {}
+    picks = []
+    skipped = []
+    for item in pool:
+        group = group_of(item[0])
+        if taken.get(group, 0) < max_per_group:
+            taken[group] = taken.get(group, 0) + 1
+            picks.append(item)
+            if len(picks) == top_k:
+                return picks
+        else:
+            skipped.append(item)
+    return picks + skipped[:top_k - len(picks)]
+
+
+@timed('search.rerank')
+def rerank(user, ranked, profiles, ml_model, top_k=10, method='mmr', pool=50, **options):
+    """Reorders the head of a score-sorted recommendation list for diversity
+
+    Only the best `pool` candidates are considered and nothing is re-scored; options go to
+    rerank_mmr (trade_off) or rerank_quota (group_by, max_per_group).
+    """
+    if method not in DIVERSITY_METHODS:
+        raise ValueError(f"Unknown diversity method: {method}")
+    head = ranked[:max(pool, top_k)]
+    if not head:
+        return []
+    if method == 'mmr':
+        return rerank_mmr(user, head, profiles, ml_model, top_k, **options)
+    return rerank_quota(user, head, profiles, ml_model, top_k, **options)
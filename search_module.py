@@ -1,12 +1,94 @@
 import networkx as nx
+from instrumentation_module import timed, count
+from graph_store_module import FriendSet, VersionedGraphStore
+from explanation_module import Explanation
+
+def candidate_pairs(users, neighbors):
+    """(pairs, spans) for a batch: every (user, friend-of-friend) pair, and each user's [start, end) slice of it
+
+    neighbors(node) returns a node's neighbors as a list. Candidates come in the same discovery order
+    as the BFS in find_recommendations, so ties sort identically.
+    """
+    pairs = []
+    spans = {}
+    for user in dict.fromkeys(users):
+        friends = set(neighbors(user))
+        seen = set()
+        start = len(pairs)
+        for friend in neighbors(user):
+            for candidate in neighbors(friend):
+                if candidate != user and candidate not in friends and candidate not in seen:
+                    seen.add(candidate)
+                    pairs.append((user, candidate))
+        spans[user] = (start, len(pairs))
+    count('search.candidates_scored', len(pairs))
+    return pairs, spans
+
+
+def score_pairs(ml_model, pairs, spans, profiles, top_k=None):
+    # One feature matrix and one model call for the whole batch, then {user: ranked candidates}
+    probabilities, similarities = ml_model.predict_friendship_batch(pairs, profiles)
+    results = {}
+    for user, (start, end) in spans.items():
+        ranked = sorted(((pairs[i][1], (probabilities[i], similarities[i])) for i in range(start, end)),
+                        key=lambda x: -x[1][0])
+        results[user] = ranked[:top_k] if top_k else ranked
+    return results
+
 
 class FriendRecommendation:
     def __init__(self, social_network, user_profiles, ml_model):
+        # social_network and user_profiles are the live structures the GUI draws from; queries read
+        # immutable snapshots from graph_store, so they can run while edits are being made
         self.social_network = social_network
         self.user_profiles = user_profiles
         self.ml_model = ml_model
+        self.graph_store = VersionedGraphStore(social_network, user_profiles)
+        self.graph_store.subscribe(ml_model.on_graph_change)
+        ml_model.graph_store = self.graph_store
+        self.debug = False  # Print every scored candidate (slow on large networks)
+        self.walk_index = None  # RandomWalkIndex, built on the first PPR query
+        self.walk_index_version = None
+        self.walk_changes = {}  # graph version -> nodes it touched, for versions after walk_index_version
+        self.graph_store.subscribe(self.on_graph_change)
+        self.name_index = None  # NameIndex for type-ahead search, built on first use
+        self.recommendation_view = None  # RecommendationView, once start_recommendation_view is called
+
+    def snapshot(self):
+        return self.graph_store.snapshot()
 
-    def find_recommendations(self, user):
+    def add_user(self, user, profile):
+        profile['friends'] = FriendSet(profile['friends'])
+        self.user_profiles[user] = profile
+        self.social_network.add_node(user)
+        with self.graph_store.batch() as batch:
+            batch.add_user(user, profile)
+        if self.name_index is not None:
+            self.name_index.add(user)
+
+    def add_friends(self, user, friends):
+        # Adds all friendships as one published version
+        friends = [friend for friend in friends if friend != user]
+        self.social_network.add_edges_from((user, friend) for friend in friends)
+        self.user_profiles[user]['friends'].update(friends)
+        with self.graph_store.batch() as batch:
+            for friend in friends:
+                self.user_profiles[friend]['friends'].add(user)
+                batch.add_edge(user, friend)
+
+    def remove_friends(self, user, friends):
+        self.social_network.remove_edges_from((user, friend) for friend in friends)
+        self.user_profiles[user]['friends'].difference_update(friends)
+        with self.graph_store.batch() as batch:
+            for friend in friends:
+                self.user_profiles[friend]['friends'].discard(user)
+                batch.remove_edge(user, friend)
+
+    @timed('search.find_recommendations')
+    def find_recommendations(self, user, snapshot=None, explanations=None):
+        # Pass a dict as explanations to also get {candidate: Explanation}, built from the scoring intermediates
+        graph = snapshot or self.graph_store.snapshot()  # One consistent version for the whole query
+        user_friends = graph.neighbor_set(user)
         visited = set() # Keep track of visited nodes
         queue = [(user, 0)] # Start with the user at depth 0
         recommendations = {} # Store recommendations with probability and similarities
@@ -18,17 +100,141 @@ class FriendRecommendation:
 
             visited.add(current) 
 
-            for neighbor in self.social_network.neighbors(current):
+            for neighbor in graph.neighbors(current):
                 # If depth is 0, we move one level deeperx
                 if depth == 0:
                     queue.append((neighbor, depth + 1))
                 # If depth is 1, neighbor is two hops away
                 elif depth == 1:
-                    if neighbor != user and neighbor not in self.social_network.neighbors(user):
-                        probability, similarities = self.ml_model.predict_friendship(user, neighbor)
+                    if neighbor != user and neighbor not in user_friends:
+                        details = {} if explanations is not None else None
+                        probability, similarities = self.ml_model.predict_friendship(
+                            user, neighbor, graph.profiles, details)
                         recommendations[neighbor] = (probability, similarities)
+                        if details is not None:
+                            explanations[neighbor] = Explanation.from_details(
+                                user, neighbor, probability, similarities, details, self.ml_model)
+        count('search.candidates_scored', len(recommendations))
+        count('search.nodes_visited', len(visited))
         # Debug-print to see each neighbor's probability and similarities
-        for name, (prob, sims) in recommendations.items():
-            print(f"Neighbor: {name},prop: {prob}, Similarities: {sims}")
+        if self.debug:
+            for name, (prob, sims) in recommendations.items():
+                print(f"Neighbor: {name},prop: {prob}, Similarities: {sims}")
         # Sort by probability descending
         return sorted(recommendations.items(), key=lambda x: -x[1][0])
+
+    def find_recommendations_diverse(self, user, top_k=10, method='mmr', pool=50, snapshot=None, **options):
+        # find_recommendations with the head reranked for diversity; see rerank_module.rerank for options
+        from rerank_module import rerank
+        graph = snapshot or self.graph_store.snapshot()
+        ranked = self.find_recommendations(user, graph)
+        return rerank(user, ranked, graph.profiles, self.ml_model, top_k, method, pool, **options)
+
+    @timed('search.ego_network')
+    def ego_network(self, user, hops=1, recommendations=None, max_nodes=500, snapshot=None):
+        """user's k-hop neighborhood as an nx.Graph, plus any recommended candidates and their links into it
+
+        Cost depends on the size of the neighborhood, not the network; the BFS stops growing at max_nodes.
+        """
+        graph = snapshot or self.graph_store.snapshot()
+        nodes = {user}
+        frontier = [user]
+        for _ in range(hops):
+            next_frontier = []
+            for node in frontier:
+                for neighbor in graph.neighbors(node):
+                    if neighbor not in nodes and len(nodes) < max_nodes:
+                        nodes.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        nodes.update(name for name, _ in recommendations or () if name in graph)
+
+        ego = nx.Graph()
+        ego.add_nodes_from(nodes)
+        ego.add_edges_from((node, neighbor) for node in nodes for neighbor in graph.neighbors(node)
+                           if neighbor in nodes)
+        return ego
+
+    @timed('search.find_recommendations_batch')
+    def find_recommendations_batch(self, users, top_k=None, snapshot=None):
+        """find_recommendations for many users at once, returned as {user: recommendations}"""
+        graph = snapshot or self.graph_store.snapshot()
+        # Neighbor lists are fetched once per node and shared by every user whose 2-hop walk reaches it
+        neighbor_cache = {}
+
+        def neighbors(node):
+            result = neighbor_cache.get(node)
+            if result is None:
+                result = neighbor_cache[node] = list(graph.neighbors(node))
+            return result
+
+        pairs, spans = candidate_pairs(users, neighbors)
+        return score_pairs(self.ml_model, pairs, spans, graph.profiles, top_k)
+
+    def start_recommendation_view(self, top_k=10, max_staleness=2.0):
+        # Keeps every user's top-K precomputed in a background thread; see materialized_view_module
+        from materialized_view_module import RecommendationView
+        if self.recommendation_view is None:
+            self.recommendation_view = RecommendationView(self, top_k, max_staleness).start()
+        return self.recommendation_view
+
+    def cached_recommendations(self, user, explanations=None):
+        # The materialized top-K when the view is running, otherwise a full on-demand query
+        if self.recommendation_view is not None:
+            return self.recommendation_view.get(user, explanations)
+        return self.find_recommendations(user, explanations=explanations)
+
+    def get_name_index(self):
+        from name_index_module import NameIndex
+        if self.name_index is None:
+            self.name_index = NameIndex(self.social_network.nodes())
+        return self.name_index
+
+    def on_graph_change(self, snapshot, touched):
+        # graph_store listener: remembers what each version touched until the walk index catches up.
+        # Past 1000 unconsumed versions the index is dropped instead, and rebuilt on the next PPR query
+        if self.walk_index is not None:
+            self.walk_changes[snapshot.version] = touched
+            if len(self.walk_changes) > 1000:
+                self.walk_index = None
+                self.walk_changes.clear()
+
+    def get_walk_index(self, snapshot=None):
+        # Brought up to the graph's version by re-walking around the touched nodes, or rebuilt when the
+        # changes since the index's version are not all known (e.g. an older snapshot was asked for)
+        from ppr_module import RandomWalkIndex
+        graph = snapshot or self.graph_store.snapshot()
+        index, version = self.walk_index, self.walk_index_version
+        if index is not None and version == graph.version:
+            return index
+        versions = range(version + 1, graph.version + 1) if index is not None else ()
+        changes = self.walk_changes
+        if versions and all(v in changes for v in versions):
+            index = index.updated(graph, set().union(*(changes[v] for v in versions)))
+        else:
+            index = RandomWalkIndex(graph)
+        for v in [v for v in list(changes) if v <= graph.version]:  # list(): the listener may add meanwhile
+            changes.pop(v, None)
+        self.walk_index, self.walk_index_version = index, graph.version
+        return index
+
+    @timed('search.find_recommendations_ppr')
+    def find_recommendations_ppr(self, user, top_k=10, candidate_pool=50, num_walks=200, alpha=0.15,
+                                 method='monte_carlo'):
+        # Candidates are the highest personalized-PageRank non-friends, then scored like find_recommendations
+        graph = self.graph_store.snapshot()
+        index = self.get_walk_index(graph)
+        if method == 'power':
+            scores = index.personalized_pagerank_power(user, alpha=alpha)
+        else:
+            scores = index.personalized_pagerank(user, num_walks=num_walks, alpha=alpha)
+        friends = graph.neighbor_set(user)
+        candidates = [node for node in sorted(scores, key=lambda node: -scores[node])
+                      if node != user and node not in friends and node in graph.profiles][:candidate_pool]
+        count('search.candidates_scored', len(candidates))
+
+        recommendations = {}
+        for candidate in candidates:
+            recommendations[candidate] = self.ml_model.predict_friendship(user, candidate, graph.profiles)
+        ranked = sorted(recommendations.items(), key=lambda x: -x[1][0])
+        return ranked[:top_k] if top_k else ranked
@@ -0,0 +1,269 @@
+import argparse
+import heapq
+import json
+import math
+import multiprocessing
+import time
+import zlib
+
+from instrumentation_module import timed
+
+
+def hash_shard(node, num_shards):
+    # Stable across processes and runs, unlike hash()
+    return zlib.crc32(str(node).encode()) % num_shards
+
+
+def partition_users(user_profiles, num_shards, method='hash', seed=42):
+    """Returns {user: shard}; 'community' keeps label-propagation communities together where sizes allow"""
+    if method == 'hash':
+        return {user: hash_shard(user, num_shards) for user in user_profiles}
+    if method != 'community':
+        raise ValueError(f"Unknown partition method: {method}")
+
+    import networkx as nx
+    graph = nx.Graph()
+    graph.add_nodes_from(user_profiles)
+    for user, profile in user_profiles.items():
+        graph.add_edges_from((user, friend) for friend in profile['friends'] if friend in user_profiles)
+    communities = sorted(nx.community.asyn_lpa_communities(graph, seed=seed), key=len, reverse=True)
+    # Fill shards in turn with whole communities, largest first; one that does not fit spills into the next shard
+    capacity = math.ceil(len(user_profiles) / num_shards)
+    owner = {}
+    shard = 0
+    filled = 0
+    for community in communities:
+        for user in sorted(community):
+            if filled >= capacity and shard < num_shards - 1:
+                shard += 1
+                filled = 0
+            owner[user] = shard
+            filled += 1
+    return owner
+
+
+def build_shards(user_profiles, owner, num_shards):
+    """Per-shard (profiles, adjacency) slices; adjacency is symmetric like create_social_network's graph"""
+    profiles = [{} for _ in range(num_shards)]
+    adjacency = [{} for _ in range(num_shards)]
+
+    def shard_of(node):
+        shard = owner.get(node)
+        return hash_shard(node, num_shards) if shard is None else shard
+
+    for user, profile in user_profiles.items():
+        profiles[shard_of(user)][user] = profile
+        for friend in profile['friends']:
+            adjacency[shard_of(user)].setdefault(user, {})[friend] = None
+            adjacency[shard_of(friend)].setdefault(friend, {})[user] = None
+    adjacency = [{node: list(neighbors) for node, neighbors in shard.items()} for shard in adjacency]
+    return profiles, adjacency
+
+
+def _score(ml_model, profiles, requests, top_k):
+    # requests: [(user, user_profile, [(order, candidate), ...])]; returns {user: [(order, candidate, (p, sims))]}
+    results = {}
+    for user, user_profile, candidates in requests:
+        guest = user not in profiles
+        if guest:
+            # The query user lives on another shard; score against the profile sent with the request
+            profiles[user] = user_profile
+            ml_model.encoder.refresh(user)
+        try:
+            probabilities, similarities = ml_model.predict_friendship_batch(
+                [(user, candidate) for _, candidate in candidates])
+        finally:
+            if guest:
+                del profiles[user]
+        scored = [(order, candidate, (probabilities[i], similarities[i]))
+                  for i, (order, candidate) in enumerate(candidates)]
+        key = lambda item: (-item[2][0], item[0])
+        results[user] = heapq.nsmallest(top_k, scored, key=key) if top_k else scored
+    return results
+
+
+def serve_shard(conn, profiles, adjacency, scaler, model, feature_set='profile'):
+    """Worker loop: answers adjacency/profile lookups and scores candidates for its own users"""
+    from ml_module import MLModel
+
+    ml_model = MLModel(profiles, feature_set)
+    ml_model.scaler, ml_model.model = scaler, model
+    while True:
+        message = conn.recv()
+        op = message[0]
+        if op == 'stop':
+            break
+        if op == 'lookup':
+            _, nodes, with_profiles = message
+            conn.send({node: (adjacency.get(node, []), profiles.get(node) if with_profiles else None)
+                       for node in nodes})
+        elif op == 'score':
+            _, requests, top_k = message
+            conn.send(_score(ml_model, profiles, requests, top_k))
+    conn.close()
+
+
+class ShardedRecommender:
+    """Coordinator for find_recommendations over users partitioned across local worker processes
+
+    A query fetches the user's friends from its shard, fans out to the friends' shards for their
+    neighbors, then asks every shard holding candidates for its local top-K. The merge orders by
+    score like the single-process path, with ties broken by each candidate's discovery order.
+    """
+
+    def __init__(self, user_profiles, ml_model, num_shards=2, method='hash'):
+        if ml_model.feature_set != 'profile':
+            raise ValueError("Sharded serving needs the 'profile' feature set; structural tables are global")
+        if not ml_model.is_trained:
+            raise ValueError("Train or load the model before starting shards")
+        self.num_shards = num_shards
+        self.owner = partition_users(user_profiles, num_shards, method)
+        profiles, adjacency = build_shards(user_profiles, self.owner, num_shards)
+        self.shard_sizes = [len(shard) for shard in profiles]
+
+        self.connections = []
+        self.processes = []
+        for shard in range(num_shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=serve_shard, name=f'shard-{shard}', daemon=True,
+                args=(child_conn, profiles[shard], adjacency[shard], ml_model.scaler, ml_model.model,
+                      ml_model.feature_set))
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def shard_of(self, node):
+        shard = self.owner.get(node)
+        return hash_shard(node, self.num_shards) if shard is None else shard
+
+    def _fan_out(self, requests):
+        # requests: {shard: message}; all are sent before any reply is read, so shards work in parallel
+        for shard, message in requests.items():
+            self.connections[shard].send(message)
+        return {shard: self.connections[shard].recv() for shard in requests}
+
+    def lookup(self, nodes, with_profiles=False):
+        by_shard = {}
+        for node in nodes:
+            by_shard.setdefault(self.shard_of(node), []).append(node)
+        replies = self._fan_out({shard: ('lookup', group, with_profiles) for shard, group in by_shard.items()})
+        merged = {}
+        for reply in replies.values():
+            merged.update(reply)
+        return merged
+
+    @timed('shard.recommend_many')
+    def recommend_many(self, users, top_k=10):
+        """{user: [(candidate, (probability, similarities))]} for a batch of users, in three fan-out rounds"""
+        users = list(dict.fromkeys(users))
+        first = self.lookup(users, with_profiles=True)
+        second = self.lookup({friend for user in users for friend in first[user][0]})
+
+        requests = {}
+        for user in users:
+            friend_list, profile = first[user]
+            friends = set(friend_list)
+            seen = set()
+            per_shard = {}
+            # Friends-of-friends in discovery order, like find_recommendations; the order index breaks score ties
+            for friend in friend_list:
+                for candidate in second[friend][0]:
+                    if candidate != user and candidate not in friends and candidate not in seen:
+                        seen.add(candidate)
+                        per_shard.setdefault(self.shard_of(candidate), []).append((len(seen), candidate))
+            for shard, candidates in per_shard.items():
+                requests.setdefault(shard, []).append((user, profile, candidates))
+        replies = self._fan_out({shard: ('score', batch, top_k) for shard, batch in requests.items()})
+
+        results = {user: [] for user in users}
+        for reply in replies.values():
+            for user, scored in reply.items():
+                results[user].extend(scored)
+        for user, scored in results.items():
+            scored.sort(key=lambda item: (-item[2][0], item[0]))
+            results[user] = [(candidate, score) for _, candidate, score in (scored[:top_k] if top_k else scored)]
+        return results
+
+    def recommend(self, user, top_k=10):
+        return self.recommend_many([user], top_k)[user]
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def run_scaling_benchmark(user_profiles, ml_model, shard_counts, queries, top_k=10, batch=200, method='hash'):
+    from benchmark_module import scores_match
+    from main import create_social_network
+    from search_module import FriendRecommendation
+
+    rows = []
+    friend_recommendation = FriendRecommendation(create_social_network(user_profiles), user_profiles, ml_model)
+    start = time.perf_counter()
+    expected = {}
+    for i in range(0, len(queries), batch):
+        expected.update(friend_recommendation.find_recommendations_batch(queries[i:i + batch], top_k))
+    elapsed = time.perf_counter() - start
+    rows.append({'mode': 'single_process', 'shards': 1, 'startup_s': 0.0, 'seconds': elapsed,
+                 'users_per_s': len(queries) / elapsed, 'matches': True})
+
+    for num_shards in shard_counts:
+        start = time.perf_counter()
+        with ShardedRecommender(user_profiles, ml_model, num_shards, method) as sharded:
+            sharded.recommend_many(queries[:1], top_k)  # Workers are up once they answer
+            startup = time.perf_counter() - start
+            start = time.perf_counter()
+            results = {}
+            for i in range(0, len(queries), batch):
+                results.update(sharded.recommend_many(queries[i:i + batch], top_k))
+            elapsed = time.perf_counter() - start
+            sizes = sharded.shard_sizes
+        matches = scores_match(results, expected, queries)
+        rows.append({'mode': method, 'shards': num_shards, 'startup_s': startup, 'seconds': elapsed,
+                     'users_per_s': len(queries) / elapsed, 'matches': matches, 'shard_sizes': sizes})
+    return rows
+
+
+def main(argv=None):
+    from benchmark_module import add_model_arguments, load_and_train
+
+    parser = argparse.ArgumentParser(description="Scaling benchmark for sharded multi-process recommendations")
+    add_model_arguments(parser)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--method', choices=['hash', 'community'], default='hash')
+    parser.add_argument('--queries', type=int, default=1000, help="users to recommend for")
+    parser.add_argument('--batch', type=int, default=200, help="users per fan-out round")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--output', default='shard_results.json')
+    args = parser.parse_args(argv)
+
+    user_profiles, ml_model, queries = load_and_train(args, args.queries)
+
+    rows = run_scaling_benchmark(user_profiles, ml_model, args.shards, queries, args.top_k, args.batch, args.method)
+    print(f"{'mode':<16}{'shards':>7}{'startup s':>11}{'seconds':>10}{'users/s':>10}  matches")
+    for row in rows:
+        print(f"{row['mode']:<16}{row['shards']:>7}{row['startup_s']:>11.3f}{row['seconds']:>10.3f}"
+              f"{row['users_per_s']:>10.1f}  {row['matches']}")
+    with open(args.output, 'w') as f:
+        json.dump({'cpus': multiprocessing.cpu_count(), 'queries': len(queries), 'rows': rows}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from encoding_module import popcount
+from instrumentation_module import timed
+
+# tmpfs on Linux, so published arrays live in RAM and are shared through the page cache
+SHARED_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+MANIFEST = 'manifest.json'
+
+
+def _csr(rows):
+    # rows: list of int arrays -> (indptr, indices)
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.concatenate(rows).astype(np.int32) if rows and indptr[-1] else np.zeros(0, dtype=np.int32)
+    return indptr, indices
+
+
+def _gather_rows(indptr, indices, rows):
+    # Concatenated CSR rows for `rows`, plus which input row each element came from
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return indices[np.repeat(starts, lengths) + offsets], owners
+
+
+class SharedStore:
+    """Publishes the graph and encoded profiles as read-only .npy files in shared memory
+
+    Worker processes attach with SharedGraphView(directory): every array is an np.load(mmap_mode='r')
+    view, so attaching takes milliseconds and all workers share one copy of the pages.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    @timed('shared.publish')
+    def publish(cls, user_profiles, ml_model, directory=None):
+        if ml_model.feature_set != 'profile':
+            raise ValueError("Shared scoring needs the 'profile' feature set; structural tables are not published")
+        directory = directory or tempfile.mkdtemp(prefix='frs_shared_', dir=SHARED_ROOT)
+        os.makedirs(directory, exist_ok=True)
+
+        # Node ids: every user with a profile, then any friend that only appears in friend lists
+        names = list(user_profiles)
+        ids = {name: i for i, name in enumerate(names)}
+        for profile in list(user_profiles.values()):
+            for friend in profile['friends']:
+                if friend not in ids:
+                    ids[friend] = len(names)
+                    names.append(friend)
+        n = len(names)
+        has_profile = np.zeros(n, dtype=bool)
+        has_profile[:len(user_profiles)] = True
+
+        # Profile friend lists (for mutual friends) and the symmetric graph (for candidate discovery)
+        friend_rows = [np.zeros(0, dtype=np.int32)] * n
+        neighbor_sets = [dict() for _ in range(n)]
+        for user, profile in user_profiles.items():
+            uid = ids[user]
+            friend_ids = [ids[friend] for friend in profile['friends']]
+            friend_rows[uid] = np.array(sorted(set(friend_ids)), dtype=np.int32)
+            for fid in friend_ids:
+                neighbor_sets[uid][fid] = None
+                neighbor_sets[fid][uid] = None
+        friend_indptr, friend_indices = _csr(friend_rows)
+        indptr, indices = _csr([np.fromiter(row, dtype=np.int32, count=len(row)) for row in neighbor_sets])
+
+        encoder = ml_model.encoder
+        encoder.ensure_many(user_profiles)
+        users = names[:len(user_profiles)]
+        interests = np.zeros((n, encoder.interests.bits.shape[1]), dtype=np.uint64)
+        activities = np.zeros((n, encoder.activities.bits.shape[1]), dtype=np.uint64)
+        interests[:len(users)] = encoder.interests.bits[[encoder.interests.rows[user] for user in users]]
+        activities[:len(users)] = encoder.activities.bits[[encoder.activities.rows[user] for user in users]]
+
+        age = np.zeros(n, dtype=np.int64)
+        occupation = np.full(n, -1, dtype=np.int32)
+        location = np.full(n, -1, dtype=np.int32)
+        codes = {}
+        for user in users:
+            profile = user_profiles[user]
+            uid = ids[user]
+            age[uid] = profile['age']
+            occupation[uid] = codes.setdefault(('occupation', profile['occupation']), len(codes))
+            location[uid] = codes.setdefault(('location', profile['location']), len(codes))
+
+        encoded_names = [name.encode() for name in names]
+        name_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded_names], out=name_offsets[1:])
+
+        arrays = {
+            'indptr': indptr, 'indices': indices,
+            'friend_indptr': friend_indptr, 'friend_indices': friend_indices,
+            'has_profile': has_profile, 'interests': interests, 'activities': activities,
+            'age': age, 'occupation': occupation, 'location': location,
+            'name_offsets': name_offsets,
+            'name_bytes': np.frombuffer(b''.join(encoded_names), dtype=np.uint8),
+        }
+        for key, array in arrays.items():
+            np.save(os.path.join(directory, f"{key}.npy"), array)
+        # The manifest goes last, so a directory with a manifest is always complete
+        with open(os.path.join(directory, MANIFEST), 'w') as f:
+            json.dump({'nodes': n, 'users': len(users), 'feature_set': ml_model.feature_set,
+                       'arrays': sorted(arrays)}, f)
+        return cls(directory)
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class SharedGraphView:
+    """Zero-copy, read-only view of a SharedStore directory that can score recommendations on its own"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        for key in self.manifest['arrays']:
+            setattr(self, key, np.load(os.path.join(directory, f"{key}.npy"), mmap_mode='r'))
+        self.nodes = self.manifest['nodes']
+        self._ids = None
+        self._mark = None  # Scratch membership array, allocated on the first query
+
+    def name(self, node_id):
+        return bytes(self.name_bytes[self.name_offsets[node_id]:self.name_offsets[node_id + 1]]).decode()
+
+    def node_id(self, name):
+        # The name -> id map is only built if a caller looks users up by name
+        if self._ids is None:
+            self._ids = {self.name(i): i for i in range(self.nodes)}
+        return self._ids[name]
+
+    def candidates(self, uid):
+        # Friends of friends, in first-discovery order, that have a profile to score
+        friends = self.indices[self.indptr[uid]:self.indptr[uid + 1]]
+        second, _ = _gather_rows(self.indptr, self.indices, friends.astype(np.int64))
+        unique, first = np.unique(second, return_index=True)
+        ordered = unique[np.argsort(first, kind='stable')]
+        keep = (ordered != uid) & ~np.isin(ordered, friends) & self.has_profile[ordered]
+        return ordered[keep]
+
+    def features(self, uid, candidates):
+        """calculate_similarity's six features for uid against every candidate, as an (n, 6) array"""
+        if self._mark is None:
+            self._mark = np.zeros(self.nodes, dtype=bool)
+        own = self.friend_indices[self.friend_indptr[uid]:self.friend_indptr[uid + 1]]
+        self._mark[own] = True
+        gathered, owners = _gather_rows(self.friend_indptr, self.friend_indices, candidates)
+        mutual = np.bincount(owners, weights=self._mark[gathered], minlength=len(candidates))
+        self._mark[own] = False
+
+        interests = self.interests[candidates]
+        activities = self.activities[candidates]
+        shared = popcount(interests & self.interests[uid]).sum(axis=1, dtype=np.int64)
+        inter = popcount(activities & self.activities[uid]).sum(axis=1, dtype=np.int64)
+        union = popcount(activities | self.activities[uid]).sum(axis=1, dtype=np.int64)
+
+        features = np.empty((len(candidates), 6), dtype=np.float64)
+        features[:, 0] = mutual
+        features[:, 1] = shared
+        features[:, 2] = 1 - np.abs(self.age[uid] - self.age[candidates]) / 100
+        features[:, 3] = np.divide(inter, union, out=np.zeros(len(candidates)), where=union > 0)
+        features[:, 4] = self.occupation[candidates] == self.occupation[uid]
+        features[:, 5] = self.location[candidates] == self.location[uid]
+        return features
+
+    def recommend(self, uid, top_k=10):
+        """[(candidate_id, probability)] ranked like find_recommendations"""
+        candidates = self.candidates(uid)
+        if not len(candidates):
+            return []
+        probabilities = np.minimum(self.features(uid, candidates), 1).sum(axis=1) / 6 * 100
+        order = np.argsort(-probabilities, kind='stable')
+        if top_k:
+            order = order[:top_k]
+        return list(zip(candidates[order].tolist(), probabilities[order].tolist()))
+
+
+_view = None
+
+
+def _attach(directory):
+    global _view
+    _view = SharedGraphView(directory)
+
+
+def _recommend_chunk(args):
+    user_ids, top_k = args
+    results = [(_view.name(uid), [(_view.name(c), p) for c, p in _view.recommend(uid, top_k)])
+               for uid in user_ids]
+    return results, (os.getpid(),) + _memory_kb()
+
+
+def _memory_kb():
+    # (RSS, PSS) of this process; PSS splits shared pages between the processes mapping them
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage.get('Rss', 0), usage.get('Pss', 0)
+
+
+@timed('shared.bulk_recommend')
+def bulk_recommend(directory, users, processes=None, top_k=10, chunk=200):
+    """{user: [(candidate, probability)]} from a pool of workers attached to a published store
+
+    Also returns each worker's last (RSS, PSS) in KiB, to show the published pages being shared.
+    """
+    view = SharedGraphView(directory)
+    user_ids = [view.node_id(user) for user in users]
+    chunks = [(user_ids[i:i + chunk], top_k) for i in range(0, len(user_ids), chunk)]
+    results = {}
+    memory = {}
+    with multiprocessing.Pool(processes, initializer=_attach, initargs=(directory,)) as pool:
+        for rows, (pid, rss, pss) in pool.imap_unordered(_recommend_chunk, chunks):
+            results.update(rows)
+            memory[pid] = (rss, pss)
+    return results, list(memory.values())
+
+
+def main(argv=None):
+    from benchmark_module import add_model_arguments, load_and_train, scores_match
+    from main import create_social_network
+    from search_module import FriendRecommendation
+
+    parser = argparse.ArgumentParser(description="Publish the model and graph to shared memory and score with workers")
+    add_model_arguments(parser)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    user_profiles, ml_model, queries = load_and_train(args, args.queries)
+
+    start = time.perf_counter()
+    with SharedStore.publish(user_profiles, ml_model) as store:
+        print(f"Published to {store.directory} in {time.perf_counter() - start:.3f}s")
+        start = time.perf_counter()
+        SharedGraphView(store.directory)
+        print(f"Attach: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        expected = FriendRecommendation(create_social_network(user_profiles), user_profiles, ml_model) \
+            .find_recommendations_batch(queries[:100], args.top_k)
+        for processes in args.processes:
+            start = time.perf_counter()
+            results, memory = bulk_recommend(store.directory, queries, processes, args.top_k)
+            elapsed = time.perf_counter() - start
+            matches = scores_match(results, expected)
+            print(f"{processes} process(es): {len(queries) / elapsed:.1f} users/s, matches={matches}, "
+                  f"max worker RSS {max(r for r, _ in memory) / 1024:.1f} MB, "
+                  f"total worker PSS {sum(p for _, p in memory) / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
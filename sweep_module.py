@@ -0,0 +1,139 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ml_module import MLModel, CLASSIFIER_TYPES, FEATURE_SETS, make_classifier
+
+# Hyperparameter grids per classifier type, applied on top of make_classifier's defaults
+PARAM_GRIDS = {
+    'logistic': {'C': [0.1, 1.0, 10.0]},
+    'decision_tree': {'max_depth': [4, 8, None], 'min_samples_leaf': [1, 5]},
+    'random_forest': {'n_estimators': [50, 100], 'max_depth': [8, None]},
+    'svm': {'C': [0.5, 1.0, 4.0], 'gamma': ['scale']},
+    'knn': {'n_neighbors': [3, 5, 11], 'weights': ['uniform', 'distance']},
+    'neural_network': {'hidden_layer_sizes': [(10,), (32,)], 'alpha': [1e-4, 1e-2]},
+}
+LATENCY_REPEATS = 200
+
+
+def subsample(X, y, max_rows, seed=42):
+    # Stratified subsample so huge training sets stay tractable for every classifier
+    if max_rows is None or len(y) <= max_rows:
+        return X, y
+    from sklearn.model_selection import train_test_split
+    X, _, y, _ = train_test_split(X, y, train_size=max_rows, stratify=y, random_state=seed)
+    return X, y
+
+
+def single_prediction_latency(estimator, X, y=None, repeats=LATENCY_REPEATS):
+    # Mirrors predict_friendship: scale one row and score it. Also a scorer, so GridSearchCV times
+    # each fold's estimator on the held-out rows in its own worker instead of refitting afterwards
+    rows = X[np.random.default_rng(0).integers(0, len(X), size=repeats)]
+    start = time.perf_counter()
+    for row in rows:
+        estimator.predict_proba(row.reshape(1, -1))
+    return (time.perf_counter() - start) / repeats
+
+
+SCORING = {'accuracy': 'accuracy', 'roc_auc': 'roc_auc', 'average_precision': 'average_precision',
+           'single_predict_s': single_prediction_latency}
+
+
+def sweep(X, y, classifier_types=None, folds=5, n_jobs=-1, verbose=True):
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    classifier_types = classifier_types or CLASSIFIER_TYPES
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    rows = []
+    for classifier_type in classifier_types:
+        if verbose:
+            print(f"Sweeping {classifier_type}...")
+        # Scaling inside the pipeline so each fold fits its own scaler, like train_model does
+        pipeline = Pipeline([('scaler', StandardScaler()), ('clf', make_classifier(classifier_type))])
+        grid = {f"clf__{name}": values for name, values in PARAM_GRIDS[classifier_type].items()}
+        search = GridSearchCV(pipeline, grid, scoring=SCORING, refit='average_precision',
+                              cv=cv, n_jobs=n_jobs, error_score=np.nan)
+        search.fit(X, y)
+
+        results = search.cv_results_
+        fold_rows = len(y) / folds
+        for i, params in enumerate(results['params']):
+            # Every configuration that fitted has its mean latency over the folds, so pick_best can
+            # weigh all of them against the target. The latency scorer's own calls are taken out of
+            # the score time before it is turned into a batch cost per row
+            latency = results['mean_test_single_predict_s'][i]
+            if np.isnan(latency) or np.isnan(results['mean_test_average_precision'][i]):
+                latency = None
+            score_time = results['mean_score_time'][i] - (latency or 0) * LATENCY_REPEATS
+            rows.append({
+                'classifier': classifier_type,
+                'params': {name[len('clf__'):]: value for name, value in params.items()},
+                'accuracy': float(results['mean_test_accuracy'][i]),
+                'roc_auc': float(results['mean_test_roc_auc'][i]),
+                'average_precision': float(results['mean_test_average_precision'][i]),
+                'fit_s': float(results['mean_fit_time'][i]),
+                'batch_us_per_row': float(score_time) / fold_rows * 1e6,
+                'single_predict_ms': float(latency) * 1000 if latency is not None else None,
+            })
+    return rows
+
+
+def print_table(rows):
+    header = f"{'classifier':<16}{'acc':>7}{'auc':>7}{'AP':>7}{'fit s':>9}{'us/row':>9}{'1-row ms':>10}  params"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        single = f"{row['single_predict_ms']:.3f}" if row['single_predict_ms'] is not None else '-'
+        print(f"{row['classifier']:<16}{row['accuracy']:>7.3f}{row['roc_auc']:>7.3f}{row['average_precision']:>7.3f}"
+              f"{row['fit_s']:>9.3f}{row['batch_us_per_row']:>9.2f}{single:>10}  {row['params']}")
+
+
+def pick_best(rows, max_latency_ms=None, metric='average_precision'):
+    # Best scoring configuration whose measured single-row latency meets the target
+    candidates = [row for row in rows if row['single_predict_ms'] is not None and not np.isnan(row[metric])]
+    if max_latency_ms is not None:
+        candidates = [row for row in candidates if row['single_predict_ms'] <= max_latency_ms]
+    return max(candidates, key=lambda row: row[metric]) if candidates else None
+
+
+def main(argv=None):
+    from main import PROFILES_CSV, load_user_profiles
+
+    parser = argparse.ArgumentParser(description="Cross-validated sweep over classifier types and hyperparameters")
+    parser.add_argument('--profiles', default=PROFILES_CSV, help="user profiles CSV file")
+    parser.add_argument('--classifier', nargs='+', choices=CLASSIFIER_TYPES, default=CLASSIFIER_TYPES)
+    parser.add_argument('--feature-set', default='profile', choices=list(FEATURE_SETS))
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1, help="parallel workers (-1 = all cores)")
+    parser.add_argument('--max-rows', type=int, help="stratified subsample of the training set")
+    parser.add_argument('--max-latency-ms', type=float, help="latency target used to pick the best model")
+    parser.add_argument('--output', default='sweep_results.json')
+    args = parser.parse_args(argv)
+
+    user_profiles = load_user_profiles(args.profiles)
+    start = time.perf_counter()
+    X, y = MLModel(user_profiles, args.feature_set).build_training_set()
+    print(f"Built {len(y)} training rows in {time.perf_counter() - start:.2f}s")
+    X, y = subsample(X, y, args.max_rows)
+
+    rows = sweep(X, y, args.classifier, folds=args.folds, n_jobs=args.jobs)
+    rows.sort(key=lambda row: -np.nan_to_num(row['average_precision']))
+    print_table(rows)
+
+    best = pick_best(rows, args.max_latency_ms)
+    if best:
+        print(f"\nBest within target: {best['classifier']} {best['params']} "
+              f"(AP {best['average_precision']:.3f}, {best['single_predict_ms']:.3f} ms/prediction)")
+    else:
+        print("\nNo configuration met the latency target")
+    with open(args.output, 'w') as f:
+        json.dump({'rows': rows, 'best': best, 'training_rows': int(len(y))}, f, indent=2, default=str)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
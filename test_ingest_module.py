@@ -0,0 +1,77 @@
+import gzip
+import json
+
+import pytest
+
+from ingest_module import IngestReport, load_network, profile_format
+
+HEADER = 'name,interests,friends,age,location,occupation,activities\n'
+
+
+def write_profiles(path, rows):
+    text = HEADER + ''.join(f'{name},Music,"{", ".join(friends)}",30,Cairo,Doctor,Running\n' for name, friends in rows)
+    if str(path).endswith('.gz'):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_self_loops_and_duplicates(tmp_path):
+    profiles = write_profiles(tmp_path / 'profiles.csv', [('A', ['B', 'A']), ('B', ['A', 'C']), ('C', [])])
+    edges = tmp_path / 'edges.txt'
+    edges.write_text('# comment\nA\tC\nC,A\nB B\nA C 0.5\n\nB\n', encoding='utf-8')
+    user_profiles, graph, report = load_network(profiles, str(edges))
+    assert sorted(map(sorted, graph.edges())) == [['A', 'B'], ['A', 'C'], ['B', 'C']]
+    assert (report.edges_read, report.edges_added, report.self_loops, report.duplicates) == (8, 3, 2, 3)
+    assert report.malformed == 1
+    # Edge-list edges are added to both friend lists; listed friends are kept as they were
+    assert list(user_profiles['A']['friends']) == ['B', 'A', 'C']
+    assert list(user_profiles['C']['friends']) == ['A']
+
+
+def test_gzip_profiles_and_edges(tmp_path):
+    profiles = write_profiles(tmp_path / 'profiles.csv.gz', [('A', ['B']), ('B', []), ('C', [])])
+    with gzip.open(tmp_path / 'edges.txt.gz', 'wt', encoding='utf-8') as f:
+        f.write('B C\n')
+    user_profiles, graph, report = load_network(profiles, str(tmp_path / 'edges.txt.gz'))
+    assert set(user_profiles) == {'A', 'B', 'C'}
+    assert graph.number_of_edges() == 2 and report.edges_added == 2
+
+
+def test_jsonl_profiles(tmp_path):
+    path = tmp_path / 'profiles.jsonl'
+    rows = [{'name': 'A', 'interests': ['Music'], 'friends': ['B'], 'age': 30, 'location': 'Cairo',
+             'occupation': 'Doctor', 'activities': ['Running', 'Chess']},
+            {'name': 'B', 'interests': 'Music', 'friends': '', 'age': 31, 'location': 'Giza',
+             'occupation': 'Teacher', 'activities': 'Running'}]
+    path.write_text('\n'.join(json.dumps(row) for row in rows) + '\n[1, 2]\n', encoding='utf-8')
+    user_profiles, graph, report = load_network(str(path))
+    assert user_profiles['A']['activities'] == 'Running, Chess'
+    assert list(graph.edges()) == [('A', 'B')]
+    assert report.malformed == 1
+
+
+def test_edges_to_users_without_a_profile_are_dropped(tmp_path):
+    # 'Ghost' is listed as a friend before and after the rows that do exist, and named in the edge list
+    profiles = write_profiles(tmp_path / 'profiles.csv', [('A', ['Ghost', 'B']), ('B', ['A', 'Later']),
+                                                          ('Later', ['Ghost'])])
+    edges = tmp_path / 'edges.txt'
+    edges.write_text('A Ghost\nB Later\n', encoding='utf-8')
+    user_profiles, graph, report = load_network(profiles, str(edges))
+    assert set(graph.nodes()) == {'A', 'B', 'Later'}
+    assert report.unknown == 3 and report.unknown_users == ['Ghost']
+    assert 'Ghost' not in user_profiles['B']['friends']
+
+
+def test_edge_list_alone_has_no_profiles(tmp_path):
+    edges = tmp_path / 'edges.txt'
+    edges.write_text('A B\nB C\n', encoding='utf-8')
+    user_profiles, graph, report = load_network(edges_path=str(edges), report=IngestReport())
+    assert user_profiles == {} and graph.number_of_edges() == 2 and report.unknown == 0
+
+
+def test_edge_list_rejected_as_profiles():
+    with pytest.raises(ValueError):
+        profile_format('edges.txt.gz')
@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from graph_store_module import FriendSet
+from ml_module import MLModel
+
+INTERESTS = [f"interest{i}" for i in range(100)]  # More than one 64-bit word of bitset
+ACTIVITIES = [f"activity{i}" for i in range(70)]
+LOCATIONS = ['Cairo', 'Giza', 'Alexandria']
+OCCUPATIONS = ['Engineer', 'Doctor', 'Teacher', 'Artist']
+
+
+def make_profiles(n=40, seed=7):
+    rng = random.Random(seed)
+    names = [f"User{i}" for i in range(n)]
+    profiles = {}
+    for name in names:
+        profiles[name] = {
+            'interests': rng.sample(INTERESTS, rng.randint(1, 12)),
+            'friends': FriendSet(),
+            'age': rng.randint(18, 70),
+            'location': rng.choice(LOCATIONS),
+            'occupation': rng.choice(OCCUPATIONS),
+            'activities': ', '.join(rng.sample(ACTIVITIES, rng.randint(1, 8))),
+        }
+    for name in names:
+        for friend in rng.sample(names, rng.randint(0, 6)):
+            if friend != name:
+                profiles[name]['friends'].add(friend)
+                profiles[friend]['friends'].add(name)
+    # Edge cases: no interests, no friends, neither, and a single empty activity
+    profiles['NoInterests'] = dict(profiles[names[0]], interests=[], friends=FriendSet(names[:3]))
+    profiles['NoFriends'] = dict(profiles[names[1]], friends=FriendSet())
+    profiles['Empty'] = dict(profiles[names[2]], interests=[], friends=FriendSet(), activities='')
+    for friend in names[:3]:
+        profiles[friend]['friends'].add('NoInterests')
+    return profiles
+
+
+def all_pairs(profiles):
+    return [(user, other) for user in profiles for other in profiles if other != user]
+
+
+@pytest.mark.parametrize('feature_set', ['profile', 'structural'])
+def test_batch_matches_per_pair(feature_set):
+    profiles = make_profiles()
+    ml_model = MLModel(profiles, feature_set)
+    pairs = all_pairs(profiles)
+    batch = ml_model.calculate_similarity_batch(pairs)
+    for pair, row in zip(pairs, batch):
+        assert row == tuple(float(value) for value in ml_model.calculate_similarity(*pair)), pair
+
+
+def test_similarity_matrix_matches_per_pair():
+    profiles = make_profiles()
+    ml_model = MLModel(profiles)
+    for user in profiles:
+        candidates = [other for other in profiles if other != user]
+        expected = np.array([ml_model.calculate_similarity(user, other) for other in candidates], dtype=np.float64)
+        assert np.array_equal(ml_model.similarity_matrix(user, candidates, dtype=np.float64), expected), user
+        # The default float32 output is the float64 values rounded once, like casting the scalar results
+        assert np.array_equal(ml_model.similarity_matrix(user, candidates), expected.astype(np.float32)), user
+
+
+def test_similarity_matrix_reads_given_profiles():
+    # A snapshot's frozen profiles (tuples for friends and interests) score the same as the live ones
+    profiles = make_profiles()
+    frozen = {name: dict(profile, friends=tuple(profile['friends']), interests=tuple(profile['interests']))
+              for name, profile in profiles.items()}
+    ml_model = MLModel(profiles)
+    candidates = [other for other in profiles if other != 'NoInterests']
+    assert np.array_equal(ml_model.similarity_matrix('NoInterests', candidates, frozen, dtype=np.float64),
+                          ml_model.similarity_matrix('NoInterests', candidates, dtype=np.float64))
+
+
+def test_similarity_matrix_empty_candidates():
+    ml_model = MLModel(make_profiles())
+    assert ml_model.similarity_matrix('User0', []).shape == (0, 6)
+    assert ml_model.calculate_similarity_batch([]) == []
+
+
+def test_similarity_matrix_follows_new_friend_tuples():
+    # Cached friend IDs are reused only while a profile keeps the same tuple, like a snapshot after an edit
+    profiles = make_profiles()
+    frozen = {name: dict(profile, friends=tuple(profile['friends'])) for name, profile in profiles.items()}
+    ml_model = MLModel(profiles)
+    candidates = [other for other in profiles if other != 'User0']
+    ml_model.similarity_matrix('User0', candidates, frozen)
+    for name in ('User0', 'NoFriends'):
+        profiles[name]['friends'].update(['User5', 'User6'])
+        frozen[name] = dict(frozen[name], friends=tuple(profiles[name]['friends']))
+    expected = np.array([ml_model.calculate_similarity('User0', other) for other in candidates], dtype=np.float64)
+    assert np.array_equal(ml_model.similarity_matrix('User0', candidates, frozen, dtype=np.float64), expected)
@@ -0,0 +1,65 @@
+import random
+
+import networkx as nx
+import numpy as np
+
+from ppr_module import RandomWalkIndex
+
+
+def make_graph(n=200, edges=600, seed=3):
+    rng = random.Random(seed)
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    while graph.number_of_edges() < edges:
+        a, b = rng.sample(range(n), 2)
+        graph.add_edge(a, b)
+    return graph
+
+
+def assert_matches_graph(index, graph):
+    assert set(index.nodes) == set(graph.nodes()) and len(index.nodes) == len(graph)
+    for node in graph.nodes():
+        i = index.node_ids[node]
+        assert {index.nodes[j] for j in index.indices[index.indptr[i]:index.indptr[i + 1]]} == set(graph[node])
+        for segment in index.segments[i]:
+            previous = node
+            for step in segment.tolist():
+                # Every step follows an edge of the current graph; isolated nodes stay put
+                assert index.nodes[step] in graph[previous] or (not graph[previous] and step == i)
+                previous = index.nodes[step]
+
+
+def test_updated_matches_edited_graph():
+    graph = make_graph()
+    index = RandomWalkIndex(graph)
+    rng = random.Random(5)
+    touched = set()
+    for _ in range(10):
+        a, b = rng.sample(range(200), 2)
+        graph.add_edge(a, b)
+        touched |= {a, b}
+    a, b = next(iter(graph.edges()))
+    graph.remove_edge(a, b)
+    graph.add_edge('new', 0)
+    touched |= {a, b, 'new', 0}
+    updated = index.updated(graph, touched)
+    assert_matches_graph(updated, graph)
+    assert updated.updates == 1
+
+    # Segments that never start at or step from a touched node are shared unchanged
+    ids = [index.node_ids[node] for node in touched if node in index.node_ids]
+    changed = np.zeros(len(index.nodes), dtype=bool)
+    changed[ids] = True
+    flat = index.segments.reshape(-1, index.segment_length)
+    starts = np.repeat(np.arange(len(index.nodes)), index.walks_per_node)
+    clean = ~(changed[starts] | changed[flat[:, :-1]].any(axis=1))
+    assert np.array_equal(updated.segments.reshape(-1, index.segment_length)[:len(flat)][clean], flat[clean])
+
+
+def test_updated_leaves_old_index_unchanged():
+    graph = make_graph()
+    index = RandomWalkIndex(graph)
+    indices, segments = index.indices.copy(), index.segments.copy()
+    graph.add_edge(1, 2)
+    index.updated(graph, {1, 2})
+    assert np.array_equal(index.indices, indices) and np.array_equal(index.segments, segments)
@@ -0,0 +1,80 @@
+import pytest
+
+from benchmark_module import scores_match
+from main import create_social_network
+from materialized_view_module import RecommendationView
+from ml_module import MLModel
+from profile_store_module import CachedProfileStore, SQLiteProfileStore, StoreRecommendation
+from search_module import FriendRecommendation
+from shard_module import ShardedRecommender
+from shared_store_module import SharedStore, bulk_recommend
+from test_ml_module import make_profiles
+
+
+@pytest.fixture(scope='module')
+def trained():
+    profiles = make_profiles()
+    ml_model = MLModel(profiles)
+    ml_model.train_model(classifier_type='logistic', max_pairs=500)
+    return profiles, ml_model
+
+
+@pytest.fixture
+def recommender(trained):
+    profiles, ml_model = trained
+    return FriendRecommendation(create_social_network(profiles), profiles, ml_model)
+
+
+@pytest.mark.parametrize('top_k', [None, 3])
+def test_batch_matches_per_user(recommender, top_k):
+    users = list(recommender.social_network.nodes())
+    batch = recommender.find_recommendations_batch(users, top_k)
+    for user in users:
+        expected = recommender.find_recommendations(user)
+        assert batch[user] == (expected[:top_k] if top_k else expected), user
+
+
+def test_view_matches_on_demand(recommender):
+    view = RecommendationView(recommender, top_k=5).start()
+    try:
+        assert view.wait_until_fresh(timeout=30)
+        recommender.add_friends('User0', ['User7', 'User8'])
+        assert view.wait_until_fresh(timeout=30)
+        users = list(recommender.social_network.nodes())
+        assert scores_match({user: view.get(user) for user in users},
+                            recommender.find_recommendations_batch(users, 5))
+        assert view.get('NotAUser') == []
+    finally:
+        view.stop()
+
+
+def test_sharded_matches_single_process(recommender):
+    users = list(recommender.social_network.nodes())
+    expected = recommender.find_recommendations_batch(users, 5)
+    with ShardedRecommender(recommender.user_profiles, recommender.ml_model, num_shards=2) as sharded:
+        assert scores_match(sharded.recommend_many(users, 5), expected)
+
+
+def test_shared_store_matches_single_process(recommender, tmp_path):
+    users = list(recommender.social_network.nodes())
+    expected = recommender.find_recommendations_batch(users, 5)
+    with SharedStore.publish(recommender.user_profiles, recommender.ml_model, str(tmp_path / 'store')) as store:
+        results, _ = bulk_recommend(store.directory, users, processes=2, top_k=5, chunk=10)
+    assert scores_match(results, expected)
+
+
+@pytest.mark.parametrize('capacity', [5, 100000])
+def test_sqlite_store_matches_in_memory(recommender, tmp_path, capacity):
+    # A cache smaller than one batch still scores from the prefetched profiles, with no per-pair misses
+    users = list(recommender.social_network.nodes())
+    store = SQLiteProfileStore(str(tmp_path / 'profiles.db'))
+    try:
+        store.import_profiles(recommender.user_profiles)
+        profiles = CachedProfileStore(store, capacity)
+        ml_model = MLModel(profiles)
+        ml_model.scaler, ml_model.model = recommender.ml_model.scaler, recommender.ml_model.model
+        results = StoreRecommendation(profiles, ml_model).find_recommendations_batch(users, 5)
+        assert scores_match(results, recommender.find_recommendations_batch(users, 5))
+        assert profiles.misses == 0
+    finally:
+        store.close()
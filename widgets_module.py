@@ -0,0 +1,129 @@
+import itertools
+import tkinter as tk
+from tkinter import ttk
+from tkinter import font as tkfont
+
+
+class VirtualListbox(ttk.Frame):
+    """Searchable listbox that only ever holds the rows currently on screen
+
+    `source(query)` returns the rows matching the search text, either as a sequence (len + indexing,
+    e.g. a NameRange) or as any iterable, which is pulled in chunks as the user scrolls. Selection is
+    kept by value, so it survives scrolling and re-filtering.
+    """
+
+    def __init__(self, parent, source, selectmode=tk.BROWSE, height=10, searchable=True, chunk=200):
+        super().__init__(parent)
+        self.source = source
+        self.selectmode = selectmode
+        self.chunk = chunk
+        self.visible = height
+        self.offset = 0
+        self.rows = []
+        self.pending = None  # Iterator of rows not loaded yet, None once the source is exhausted
+        self.window = []
+        self.selected = {}  # value -> None, kept in selection order
+        self.query = tk.StringVar()
+
+        if searchable:
+            self.search_entry = ttk.Entry(self, textvariable=self.query)
+            self.search_entry.pack(fill="x", pady=(0, 2))
+            self.query.trace_add('write', lambda *args: self.refresh(reset=True))
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+        self.listbox = tk.Listbox(body, height=height, selectmode=selectmode, exportselection=False)
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.row_height = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace') + 1
+
+        self.listbox.bind('<<ListboxSelect>>', self.on_select)
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<MouseWheel>', lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+        self.listbox.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self.scroll_by(-1))
+        self.listbox.bind('<Down>', lambda e: self.scroll_by(1))
+        self.listbox.bind('<Prior>', lambda e: self.scroll_by(-self.visible))
+        self.listbox.bind('<Next>', lambda e: self.scroll_by(self.visible))
+
+        self.refresh(reset=True)
+
+    def refresh(self, reset=False):
+        # Re-query the source, e.g. after the search text or the underlying data changed
+        rows = self.source(self.query.get())
+        if hasattr(rows, '__getitem__') and hasattr(rows, '__len__'):
+            self.rows, self.pending = rows, None
+        else:
+            self.rows, self.pending = [], iter(rows)
+        if reset:
+            self.offset = 0
+        self.render()
+
+    def load(self, count):
+        # Pull rows from a lazy source until `count` are available or it runs out
+        if self.pending is None or len(self.rows) >= count:
+            return
+        target = count + self.chunk
+        self.rows.extend(itertools.islice(self.pending, target - len(self.rows)))
+        if len(self.rows) < target:
+            self.pending = None
+
+    def total(self):
+        # Known row count; while a lazy source still has rows, leave room to scroll into them
+        return len(self.rows) + (self.visible if self.pending is not None else 0)
+
+    def render(self):
+        self.load(self.offset + self.visible)
+        self.offset = max(0, min(self.offset, len(self.rows) - self.visible))
+        self.window = list(self.rows[self.offset:self.offset + self.visible])
+
+        self.listbox.delete(0, tk.END)
+        if self.window:
+            self.listbox.insert(tk.END, *self.window)
+        for i, value in enumerate(self.window):
+            if value in self.selected:
+                self.listbox.selection_set(i)
+
+        total = self.total()
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(self.window)) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_by(self, rows):
+        self.offset = max(0, self.offset + rows)
+        self.render()
+        return "break"  # The listbox itself never scrolls
+
+    def on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.offset = max(0, int(float(args[1]) * self.total()))
+            self.render()
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            self.scroll_by(step * self.visible if args[2] == 'pages' else step)
+
+    def on_resize(self, event):
+        visible = max(1, event.height // self.row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def on_select(self, event=None):
+        chosen = set(self.listbox.curselection())
+        if self.selectmode != tk.MULTIPLE:
+            self.selected.clear()
+        for i, value in enumerate(self.window):
+            if i in chosen:
+                self.selected[value] = None
+            else:
+                self.selected.pop(value, None)
+
+    def selection(self):
+        return list(self.selected)
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.listbox.selection_clear(0, tk.END)